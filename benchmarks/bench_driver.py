@@ -0,0 +1,128 @@
+"""Benchmarks for the SynthHD driver.
+
+Measures throughput and latency percentiles of common operations against
+the software emulator, or a device if a path is given. With the emulator
+and the default byte time of 0 the results reflect the CPU cost of the
+driver and emulator only.
+
+Usage:
+    python -m benchmarks.bench_driver [--devpath /dev/ttyACM0]
+        [--model 'SynthHD v2'] [--byte-time 0] [--iterations 1000]
+"""
+
+import argparse
+from statistics import quantiles
+from time import perf_counter
+from windfreak import SynthHD
+from windfreak.emulator import SynthHDEmulator
+
+
+def frequency_hop(synth, index):
+    synth[0].frequency = 1.e9 + (index % 100) * 1.e6
+
+
+def power_set(synth, index):
+    synth[0].power = -20. + (index % 100) * 0.1
+
+
+def init(synth, index):
+    synth.init()
+
+
+def lookup_table_upload(synth, index, rows=100):
+    # Every row changes between iterations
+    synth[0].am_table = [-30. + ((row + index) % rows) * 0.1 for row in range(rows)]
+
+
+def sweep_configuration(synth, index):
+    synth[0].select()
+    synth.write('sweep_freq_low', 1000.)
+    synth.write('sweep_freq_high', 2000. + index % 100)
+    synth.write('sweep_freq_step', 1.)
+    synth.write('sweep_time_step', 4.)
+    synth.write('sweep_power_low', -10.)
+    synth.write('sweep_power_high', -10.)
+    synth.write('sweep_direction', 1)
+    synth.write('sweep_type', 0)
+
+
+def frequency_readback(synth, index):
+    synth[0].frequency
+
+
+BENCHMARKS = (
+    ('frequency hop', frequency_hop),
+    ('power set', power_set),
+    ('frequency readback', frequency_readback),
+    ('init()', init),
+    ('lookup table upload (100 rows)', lookup_table_upload),
+    ('sweep configuration', sweep_configuration),
+)
+
+
+def run(synth, func, iterations, commands=None):
+    """Time a benchmark function.
+
+    Args:
+        synth (SynthHD): device
+        func (callable): called as func(synth, index)
+        iterations (int): number of calls
+        commands (callable): returns the number of commands the device has
+            executed, or None if unknown
+
+    Returns:
+        dict: results
+    """
+    latencies = []
+    start_commands = commands() if commands else None
+    start = perf_counter()
+    for index in range(iterations):
+        t0 = perf_counter()
+        func(synth, index)
+        latencies.append(perf_counter() - t0)
+    elapsed = perf_counter() - start
+    percentiles = quantiles(latencies, n=100)
+    result = {
+        'ops_per_sec': iterations / elapsed,
+        'p50': percentiles[49],
+        'p99': percentiles[98],
+        'cmds_per_sec': None,
+    }
+    if commands:
+        result['cmds_per_sec'] = (commands() - start_commands) / elapsed
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devpath', help='device path, emulator if omitted')
+    parser.add_argument('--model', default='SynthHD v2', help='emulated model')
+    parser.add_argument('--byte-time', type=float, default=0.,
+                        help='emulated seconds per byte')
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.devpath:
+        synth = SynthHD(args.devpath)
+        commands = None
+    else:
+        emulator = SynthHDEmulator(args.model, byte_time=args.byte_time)
+        synth = SynthHD('emulator', serial_factory=emulator.connect)
+        commands = lambda: emulator.commands
+    synth.init()
+
+    print('{:<32} {:>12} {:>12} {:>12} {:>12}'.format(
+          'benchmark', 'ops/s', 'cmds/s', 'p50 (us)', 'p99 (us)'))
+    for name, func in BENCHMARKS:
+        iterations = max(args.iterations // 20, 5) if func in (init, lookup_table_upload) \
+            else args.iterations
+        result = run(synth, func, iterations, commands)
+        cmds = '-' if result['cmds_per_sec'] is None else '{:.0f}'.format(result['cmds_per_sec'])
+        print('{:<32} {:>12.0f} {:>12} {:>12.1f} {:>12.1f}'.format(
+              name, result['ops_per_sec'], cmds, result['p50'] * 1e6, result['p99'] * 1e6))
+    synth.init()
+    synth.close()
+
+
+if __name__ == '__main__':
+    main()
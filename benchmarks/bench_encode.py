@@ -0,0 +1,72 @@
+"""Micro-benchmark of request encoding.
+
+Compares the per-command CPU cost of the compiled command encoders used by
+SerialDevice with direct formatting from the API table, and times complete
+SynthHD writes to a port that discards the data.
+
+Usage:
+    python -m benchmarks.bench_encode [--iterations 200000]
+"""
+
+import argparse
+from timeit import timeit
+from windfreak import SynthHD
+from windfreak.emulator import SynthHDEmulator
+
+
+def format_request(api, attribute, *args):
+    """Encode a write request directly from the API table."""
+    dtype, request, _ = api[attribute]
+    dtype = dtype if isinstance(dtype, tuple) else (dtype,)
+    if len(args) != len(dtype):
+        raise ValueError('Number of arguments and data-types are not equal.')
+    args = ((int(ar) if dt is bool else dt(ar)) for dt, ar in zip(dtype, args))
+    return request.format(*args).encode('utf-8')
+
+
+class NullPort:
+
+    def __init__(self, port=None, timeout=None):
+        pass
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+CASES = (
+    ('frequency', (1234.5678,)),
+    ('power', (-10.,)),
+    ('rf_enable', (True,)),
+    ('am_lookup_table', (10, -12.5)),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    emulator = SynthHDEmulator()
+    synth = SynthHD('emulator', serial_factory=emulator.connect)
+    synth.close()
+    synth._serial_factory = NullPort
+    synth.open()
+    api = SynthHD.API
+
+    print('{:<20} {:>14} {:>14} {:>14}'.format(
+          'attribute', 'format (ns)', 'compiled (ns)', 'write (ns)'))
+    for attribute, values in CASES:
+        assert format_request(api, attribute, *values) == synth.encode(attribute, *values)
+        t_format = timeit(lambda: format_request(api, attribute, *values), number=n)
+        t_compiled = timeit(lambda: synth.encode(attribute, *values), number=n)
+        t_write = timeit(lambda: synth.write(attribute, *values), number=n)
+        print('{:<20} {:>14.0f} {:>14.0f} {:>14.0f}'.format(
+              attribute, t_format / n * 1e9, t_compiled / n * 1e9, t_write / n * 1e9))
+
+
+if __name__ == '__main__':
+    main()
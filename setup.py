@@ -16,7 +16,7 @@ setup(
     url='https://github.com/christian-hahn/windfreak-python',
     packages=find_packages(exclude=['tests', 'examples']),
     install_requires=[
-        'pyserial',
+        'pyserial>=3.3',
     ],
     classifiers=[
         'Programming Language :: Python :: 3',
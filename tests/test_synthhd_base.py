@@ -3,8 +3,16 @@
 This module contains common unit-tests for the SynthHD object.
 """
 
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from math import floor
+from threading import Event, Thread
 from time import sleep
+from windfreak import AsyncSynthHD, Hopper, PresetStore, PulseProgram, Sweep
 
 
 class SynthHDBaseTestCase:
@@ -56,6 +64,122 @@ class SynthHDBaseTestCase:
             self.assertIsInstance(read, str)
             self.assertEqual(read, mode)
 
+    def test_cache(self):
+        self._dut.cache = True
+        try:
+            self._dut.reference_mode = 'internal 10mhz'
+            self.assertEqual(self._dut.reference_mode, 'internal 10mhz')
+            for channel in self._dut:
+                channel.power = self.NOMINAL_POWER
+                self.assertEqual(channel.power, self.NOMINAL_POWER)
+            self._dut.refresh()
+            self.assertEqual(self._dut.reference_mode, 'internal 10mhz')
+            for channel in self._dut:
+                self.assertEqual(channel.power, self.NOMINAL_POWER)
+        finally:
+            self._dut.cache = False
+
+    def test_dirty_only(self):
+        self._dut.dirty_only = True
+        try:
+            for channel in self._dut:
+                channel.power = self.NOMINAL_POWER
+                channel.enable = False
+            suppressed = self._dut.suppressed_writes
+            for channel in self._dut:
+                channel.power = self.NOMINAL_POWER
+                channel.enable = False
+                self.assertEqual(channel.power, self.NOMINAL_POWER)
+                self.assertFalse(channel.enable)
+            self.assertEqual(self._dut.suppressed_writes - suppressed, 4 * len(self._dut))
+        finally:
+            self._dut.dirty_only = False
+
+    def test_verify(self):
+        with self._dut.batch(verify=True):
+            for channel in self._dut:
+                channel.power = self.NOMINAL_POWER
+                channel.enable = False
+        self.assertFalse(self._dut.verify_later)
+        self._dut.verify_later = True
+        try:
+            self._dut[0].frequency = 1.e9
+            self._dut[0].power = self.NOMINAL_POWER
+            self._dut.verify()
+            self._dut.verify()
+        finally:
+            self._dut.verify_later = False
+
+    def test_instrumentation(self):
+        self.assertEqual(self._dut.stats(), {})
+        instrumentation = self._dut.instrument(trace=True)
+        events = []
+        instrumentation.hooks.append(events.append)
+        try:
+            self._dut[0].frequency = self.NOMINAL_FREQUENCY
+            self._dut[1].frequency = self.NOMINAL_FREQUENCY
+            self._dut[1].power
+            self._dut.read_many(('temperature',), ('reference_mode',))
+            stats = self._dut.stats()
+            self.assertEqual(stats['frequency']['writes'], 2)
+            self.assertEqual(stats['power']['reads'], 1)
+            self.assertEqual(stats['temperature']['reads'], 1)
+            self.assertGreaterEqual(stats['channel']['writes'], 1)
+            self.assertEqual(stats['total']['timeouts'], 0)
+            self.assertEqual(stats['total']['reads'], 3)
+            self.assertGreater(stats['total']['bytes_in'], 0)
+            self.assertGreater(stats['power']['latency']['max'], 0.)
+            self.assertEqual(len(events), sum(
+                stats['total'][kind] for kind in ('reads', 'writes', 'cached')))
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'trace.json')
+                instrumentation.export_trace(path)
+                with open(path) as file:
+                    trace = json.load(file)
+            self.assertEqual(len(trace['traceEvents']), len(events))
+        finally:
+            self._dut.instrument(False)
+        self.assertIsNone(self._dut.instrumentation)
+
+    def test_instrumentation_threads(self):
+        instrumentation = self._dut.instrument(trace=True)
+        done = Event()
+
+        def record():
+            # New attributes and events while the statistics are read
+            for index in range(20000):
+                instrumentation.record('read', 'attribute{}'.format(index), 0., 1.e-3)
+            done.set()
+
+        thread = Thread(target=record)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1.e-6)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'trace.json')
+                thread.start()
+                while not done.is_set():
+                    self._dut.stats()
+                    instrumentation.export_trace(path)
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+            self._dut.instrument(False)
+        self.assertEqual(instrumentation.stats()['total']['reads'], 20000)
+
+    def test_encode(self):
+        samples = {int: 7, float: -12.3456789, bool: True}
+        for attribute, (dtype, request, _) in self._dut.API.items():
+            if request is None:
+                continue
+            dtype = dtype if isinstance(dtype, tuple) else (dtype,)
+            args = [samples[dt] for dt in dtype]
+            expected = request.format(*(int(ar) if dt is bool else dt(ar)
+                                        for dt, ar in zip(dtype, args)))
+            self.assertEqual(self._dut.encode(attribute, *args), expected.encode('utf-8'))
+            with self.assertRaises(ValueError):
+                self._dut.encode(attribute, *args, 0)
+
     def test_temperature(self):
         value = self._dut.temperature
         self.assertIsInstance(value, float)
@@ -84,6 +208,15 @@ class SynthHDBaseTestCase:
 
     ## Channel
 
+    def test_channel_select(self):
+        freqs = [self.NOMINAL_FREQUENCY * (index + 1) for index in range(len(self._dut))]
+        for channel, freq in zip(self._dut, freqs):
+            channel.frequency = freq
+        for index in range(len(self._dut)):
+            self._dut.write('channel', index)
+            self.assertEqual(self._dut.read('channel'), index)
+            self.assertEqual([ch.frequency for ch in self._dut], freqs)
+
     def test_frequency(self):
         for index, channel in enumerate(self._dut):
             others = [ch for ch in self._dut if not ch is channel]
@@ -227,6 +360,104 @@ class SynthHDBaseTestCase:
                 self.assertEqual(before, after)
                 self.assertEqual(value, read)
 
+    def test_batch(self):
+        with self._dut.batch():
+            for channel in self._dut:
+                channel.frequency = self.NOMINAL_FREQUENCY
+                channel.power = self.NOMINAL_POWER
+            self.assertEqual(self._dut[0].frequency, self.NOMINAL_FREQUENCY)
+            self._dut[0].enable = True
+        for channel in self._dut:
+            self.assertEqual(channel.frequency, self.NOMINAL_FREQUENCY)
+            self.assertEqual(channel.power, self.NOMINAL_POWER)
+        self.assertTrue(self._dut[0].enable)
+
+    def test_snapshot(self):
+        state = self._dut.snapshot()
+        self.assertEqual(state[(1, 'frequency')], self._dut[1].frequency / 1e6)
+        self.assertEqual(state[(None, 'reference_mode')],
+                         self._dut.reference_modes.index(self._dut.reference_mode))
+        with self.assertRaises(TypeError):
+            state[(1, 'frequency')] = 0.
+        self.assertEqual(self._dut.apply(state), 0)
+        self._dut[1].frequency = 2 * self.NOMINAL_FREQUENCY
+        self._dut[1].enable = True
+        self.assertEqual(self._dut.apply(state), 4)
+        self.assertEqual(self._dut.snapshot(), state)
+        other = state.replace({(0, 'power'): self.NOMINAL_POWER + 1.})
+        self.assertEqual(other.diff(state), {(0, 'power'): (self.NOMINAL_POWER + 1.,
+                                                            state[(0, 'power')])})
+        self._dut.refresh()
+        self.assertEqual(self._dut.apply(other, base=state), 1)
+        self.assertEqual(self._dut[0].power, self.NOMINAL_POWER + 1.)
+        self.assertEqual(self._dut.apply(state, base=other), 1)
+        tables = self._dut.snapshot(tables=True)
+        self.assertEqual(len(tables) - len(state), 2 * (
+            self._dut[0].am_table_size + 2 * self._dut[0].sweep_table_size))
+
+    def test_presets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'presets.json')
+            presets = PresetStore(path)
+            self._dut[0].frequency = self.NOMINAL_FREQUENCY
+            presets.save('nominal', self._dut)
+            self._dut[0].frequency = 2 * self.NOMINAL_FREQUENCY
+            presets.save('hopped', self._dut)
+            self.assertEqual(list(presets), ['nominal', 'hopped'])
+            self.assertEqual(presets.model('nominal'), self._dut.model)
+            presets = PresetStore(path)
+            self.assertEqual(presets.apply('hopped', self._dut), 0)
+            self.assertEqual(presets.apply('nominal', self._dut), 1)
+            self.assertEqual(self._dut[0].frequency, self.NOMINAL_FREQUENCY)
+            self.assertEqual(presets['hopped'].diff(presets['nominal']),
+                             {(0, 'frequency'): (2 * self.NOMINAL_FREQUENCY / 1e6,
+                                                 self.NOMINAL_FREQUENCY / 1e6)})
+            presets['copy'] = presets['nominal']
+            del presets['hopped']
+            self.assertEqual(list(PresetStore(path)), ['nominal', 'copy'])
+
+    def test_threads(self):
+        frequencies = (self.NOMINAL_FREQUENCY, 2 * self.NOMINAL_FREQUENCY)
+
+        def hop(index):
+            channel = self._dut[index]
+            for _ in range(200):
+                channel.frequency = frequencies[index]
+                self.assertEqual(channel.frequency, frequencies[index])
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1.e-6)
+        try:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(hop, range(2)))
+        finally:
+            sys.setswitchinterval(interval)
+        for channel, frequency in zip(self._dut, frequencies):
+            self.assertEqual(channel.frequency, frequency)
+
+    def test_select_threads(self):
+        power = self._dut[1].power
+        done = Event()
+
+        def select():
+            while not done.is_set():
+                self._dut[1].select()
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1.e-6)
+        thread = Thread(target=select)
+        thread.start()
+        try:
+            for _ in range(2000):
+                self._dut[0].power = self.NOMINAL_POWER
+        finally:
+            done.set()
+            thread.join()
+            sys.setswitchinterval(interval)
+        self.assertNotEqual(power, self.NOMINAL_POWER)
+        self.assertEqual(self._dut[1].power, power)
+        self.assertEqual(self._dut[0].power, self.NOMINAL_POWER)
+
     def test_rf_enable(self):
         self.channel_enable_helper('rf_enable')
 
@@ -239,6 +470,119 @@ class SynthHDBaseTestCase:
     def test_enable(self):
         self.channel_enable_helper('enable')
 
+    def test_sweep_table(self):
+        for channel in self._dut:
+            f_range = channel.frequency_range
+            p_range = channel.power_range
+            rows = 10
+            table = {
+                'frequency': [f_range['start'] + 1.e6 * row for row in range(rows)],
+                'power': [max(p_range['start'], -40.) + row for row in range(rows)],
+            }
+            channel.sweep_table = table
+            read = channel.sweep_table
+            self.assertEqual(list(read['frequency']), table['frequency'])
+            self.assertEqual(list(read['power']), table['power'])
+            table['frequency'] = table['frequency'][:5]
+            table['power'] = table['power'][:5]
+            suppressed = self._dut.suppressed_writes
+            channel.sweep_table = table
+            self.assertEqual(self._dut.suppressed_writes - suppressed, 10)
+            self.assertEqual(list(channel.sweep_table['frequency']), table['frequency'])
+            with self.assertRaises(ValueError):
+                channel.sweep_table = {'frequency': [f_range['stop'] * 2], 'power': [0.]}
+            with self.assertRaises(ValueError):
+                channel.sweep_table = {'frequency': [f_range['start']], 'power': []}
+
+    def test_sweep(self):
+        for channel in self._dut:
+            f_start = channel.frequency_range['start']
+            sweep = Sweep(channel, f_start, f_start + 100.e6, 1.e6, time_step=4.,
+                          power_start=self.NOMINAL_POWER)
+            self.assertEqual(sweep.points, 101)
+            self.assertAlmostEqual(sweep.duration, 0.404)
+            sweep.apply()
+            self.assertEqual(sweep.apply(), 0)
+            self.assertEqual(channel.read('sweep_freq_low') * 1e6, f_start)
+            self.assertEqual(channel.read('sweep_time_step'), 4.)
+            sweep.run_single()
+            sweep.start()
+            self.assertTrue(self._dut.sweep_enable)
+            sweep.stop()
+            self.assertFalse(self._dut.sweep_enable)
+            with self.assertRaises(ValueError):
+                Sweep(channel, f_start + 1.e6, f_start, 1.e6, time_step=4.)
+            with self.assertRaises(ValueError):
+                Sweep(channel, f_start, f_start + 1.e6, 1.e6, time_step=1.)
+
+    def test_pulse_program(self):
+        for channel in self._dut:
+            program = PulseProgram(channel, on_time=10, off_time=90, repetitions=100)
+            self.assertAlmostEqual(program.duration, 0.01)
+            program.apply()
+            self.assertEqual(program.apply(), 0)
+            self.assertEqual(channel.read('pulse_on_time'), 10)
+            self.assertEqual(channel.read('pulse_off_time'), 90)
+            self.assertEqual(channel.read('pulse_num_rep'), 100)
+            self.assertFalse(channel.read('pulse_invert'))
+            suppressed = self._dut.suppressed_writes
+            for _ in range(3):
+                program.fire()
+            self.assertEqual(self._dut.suppressed_writes, suppressed)
+            PulseProgram(channel, on_time=20, off_time=90).fire()
+            self.assertEqual(channel.read('pulse_on_time'), 20)
+            program.start()
+            self.assertTrue(channel.read('pulse_cont'))
+            program.stop()
+            self.assertFalse(channel.read('pulse_cont'))
+            with self.assertRaises(ValueError):
+                PulseProgram(channel, on_time=0, off_time=90)
+            with self.assertRaises(ValueError):
+                PulseProgram(channel, on_time=10, off_time=90, repetitions=65501)
+            with self.assertRaises(TypeError):
+                PulseProgram(channel, on_time=10., off_time=90)
+
+    def test_hopper(self):
+        freqs = [self.NOMINAL_FREQUENCY + 1.e6 * step for step in range(20)]
+        schedule = [(step * 5.e-3, step % len(self._dut), freq, self.NOMINAL_POWER)
+                    for step, freq in enumerate(freqs)]
+        hopper = Hopper(self._dut, schedule)
+        hopper.start()
+        hopper.join()
+        self.assertFalse(hopper.running)
+        stats = hopper.stats
+        self.assertEqual(stats['steps'], len(schedule))
+        for key in ('missed', 'mean', 'p50', 'p99', 'max'):
+            self.assertIn(key, stats)
+        for index, channel in enumerate(self._dut):
+            self.assertEqual(channel.frequency, freqs[-len(self._dut) + index])
+            self.assertEqual(channel.power, self.NOMINAL_POWER)
+        with self.assertRaises(ValueError):
+            Hopper(self._dut, [(0., 0, 0., None)])
+        p_range = self._dut[0].power_range
+        if p_range is not None:
+            with self.assertRaises(ValueError):
+                Hopper(self._dut, [(0., 0, self.NOMINAL_FREQUENCY, p_range['stop'] + 1.)])
+
+    def test_hopper_shared(self):
+        # Another user selects channel 1 between two hops of channel 0
+        hopper = Hopper(self._dut, [(0., 0, self.NOMINAL_FREQUENCY, None),
+                                    (.2, 0, 2 * self.NOMINAL_FREQUENCY, None)])
+        hopper.start()
+        sleep(.1)
+        self._dut[1].frequency = 3 * self.NOMINAL_FREQUENCY
+        hopper.join()
+        self.assertEqual(self._dut[0].frequency, 2 * self.NOMINAL_FREQUENCY)
+        self.assertEqual(self._dut[1].frequency, 3 * self.NOMINAL_FREQUENCY)
+        # A step delayed by another user holding the device is late
+        hopper = Hopper(self._dut, [(0., 0, self.NOMINAL_FREQUENCY, None)])
+        with self._dut.transaction():
+            hopper.start()
+            sleep(.05)
+        hopper.join()
+        self.assertEqual(hopper.stats['missed'], 1)
+        self.assertGreaterEqual(hopper.stats['max'], .05)
+
     def test_lock_status(self):
         for channel in self._dut:
             channel.frequency = self.NOMINAL_FREQUENCY
@@ -249,6 +593,29 @@ class SynthHDBaseTestCase:
             self.assertIsInstance(value, bool)
             self.assertTrue(value)
 
+    def test_am_table(self):
+        tables = []
+        for index, channel in enumerate(self._dut):
+            size = channel.am_table_size
+            self.assertIsInstance(size, int)
+            table = [-30. + 0.5 * ((row + index) % 40) for row in range(size)]
+            channel.am_table = table
+            read = channel.am_table
+            self.assertEqual(list(read), table)
+            suppressed = self._dut.suppressed_writes
+            table[3] = -10.
+            channel.am_table = table
+            self.assertEqual(self._dut.suppressed_writes - suppressed, size - 1)
+            self.assertEqual(list(channel.am_table), table)
+            with self.assertRaises(ValueError):
+                channel.am_table = [100.]
+            with self.assertRaises(ValueError):
+                channel.am_table = [0.] * (size + 1)
+            tables.append(table)
+        # Tables are per channel, regardless of the selected channel
+        self._dut.write('channel', 1)
+        self.assertEqual(list(self._dut[0].am_table), tables[0])
+
     def test_modulation_enables(self):
         enables = ('sweep_enable', 'am_enable', 'pulse_mod_enable',
                    'dual_pulse_mod_enable', 'fm_enable')
@@ -264,6 +631,27 @@ class SynthHDBaseTestCase:
                 self.assertEqual(value, read)
 
 
+    ## Asyncio
+
+    def test_async(self):
+        async def run():
+            async with AsyncSynthHD(self.DEVPATH) as synth:
+                self.assertEqual(synth.model, self._dut.model)
+                for channel in synth:
+                    await channel.set_frequency(self.NOMINAL_FREQUENCY)
+                    await channel.set_power(self.NOMINAL_POWER)
+                reads = await asyncio.gather(*(ch.get_frequency() for ch in synth),
+                                             *(ch.get_power() for ch in synth))
+                self.assertEqual(reads, [self.NOMINAL_FREQUENCY] * len(synth)
+                                 + [self.NOMINAL_POWER] * len(synth))
+                self.assertIn(await synth.get_reference_mode(), synth.reference_modes)
+        self._dut.close()
+        try:
+            asyncio.run(run())
+        finally:
+            self._dut.open()
+
+
 class SynthHDv2BaseTestCase(SynthHDBaseTestCase):
 
     def test_channel_spacing(self):
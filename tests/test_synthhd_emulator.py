@@ -0,0 +1,401 @@
+"""Tests for SynthHD object.
+
+This module runs the SynthHD unit-tests against the software emulator, so
+that they do not require a device.
+"""
+
+import asyncio
+import gc
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from unittest import mock
+from serial import Serial
+from serial.tools.list_ports_common import ListPortInfo
+from test_synthhd_base import SynthHDBaseTestCase, SynthHDv2BaseTestCase
+from windfreak import (AsyncSynthHD, PulseProgram, Sweep, SynthHD, SynthHDFleet,
+                       VerificationError, discover)
+from windfreak.discovery import USB_IDS
+from windfreak.emulator import SynthHDEmulator
+from windfreak.recording import Recorder, Replayer
+
+
+class SynthHDEmulatorTestCase:
+
+    MODEL = None
+
+    def setUp(self):
+        self._emulator = SynthHDEmulator(self.MODEL)
+        # Out-of-process clients, e.g. AsyncSynthHD, connect through the pty
+        self.DEVPATH = self._emulator.open_pty()
+        self._dut = SynthHD(self.DEVPATH, serial_factory=self._emulator.connect)
+        self._dut.init()
+
+    def tearDown(self):
+        self._dut.init()
+        self._dut.close()
+        del self._dut
+        self._emulator.close_pty()
+
+    def test_model(self):
+        model = self._dut.model
+        self.assertIsInstance(model, str)
+        self.assertEqual(model, self.MODEL)
+
+    def test_lazy_model(self):
+        commands = self._emulator.commands
+        synth = SynthHD(self.DEVPATH, serial_factory=self._emulator.connect)
+        self.assertEqual(self._emulator.commands, commands)
+        self.assertEqual(len(synth), 2)
+        self.assertEqual(synth.model, self.MODEL)
+        self.assertGreater(self._emulator.commands, commands)
+        synth = SynthHD(self.DEVPATH, model=self.MODEL, serial_factory=self._emulator.connect)
+        commands = self._emulator.commands
+        self.assertEqual(synth.model, self.MODEL)
+        self.assertIsNotNone(synth[1].frequency_range)
+        self.assertEqual(self._emulator.commands, commands)
+        with self.assertRaises(ValueError):
+            SynthHD(self.DEVPATH, model='SynthHD v3', serial_factory=self._emulator.connect)
+
+    def test_identity_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'identities.json')
+            synth = SynthHD(self.DEVPATH, identity_cache=path,
+                            serial_factory=self._emulator.connect)
+            self.assertEqual(synth.model, self.MODEL)
+            commands = self._emulator.commands
+            synth = SynthHD(self.DEVPATH, identity_cache=path,
+                            serial_factory=self._emulator.connect)
+            self.assertEqual(synth.model, self.MODEL)
+            self.assertEqual(self._emulator.commands, commands)
+
+    def test_timeouts(self):
+        synth = SynthHD(self.DEVPATH, model=self.MODEL, adaptive_timeout=True,
+                        serial_factory=self._emulator.connect)
+        for _ in range(10):
+            synth.temperature
+        self.assertEqual(synth._dev.timeout, .125)
+        synth.save()
+        rtt = synth._rtt
+        self._emulator.byte_time = .01
+        try:
+            synth.temperature
+        finally:
+            self._emulator.byte_time = 0.
+        self.assertGreater(synth._dev.timeout, synth.timeouts['save'])
+        # Not a round trip, the device was busy
+        self.assertEqual(synth._rtt, rtt)
+        # A late response is not taken for the next one
+        synth[0].power = -5.
+        synth.refresh()
+        self._emulator.late_responses = 1
+        with self.assertRaises(TimeoutError):
+            synth[0].frequency
+        self.assertEqual(synth[0].power, -5.)
+        self.assertEqual(synth[0].frequency, self._emulator.get('frequency', channel=0) * 1e6)
+        # A response arriving after the timeout
+        synth = SynthHD(self.DEVPATH, model=self.MODEL)
+        synth[0].frequency = 1.5e9
+        synth[0].power = -5.
+        synth.timeouts['frequency'] = .05
+        self._emulator.byte_time = .01
+        try:
+            with self.assertRaises(TimeoutError):
+                synth[0].frequency
+            self.assertEqual(synth[0].power, -5.)
+        finally:
+            self._emulator.byte_time = 0.
+            synth.close()
+        # A port that never answers
+        master, slave = os.openpty()
+        try:
+            synth = SynthHD(os.ttyname(slave), model=self.MODEL)
+            synth.timeouts['temperature'] = .05
+            start = monotonic()
+            with self.assertRaises(TimeoutError):
+                synth.temperature
+            self.assertLess(monotonic() - start, 1.)
+            synth.close()
+        finally:
+            os.close(slave)
+            os.close(master)
+
+    def test_reconnect(self):
+        ports = []
+        plugged = [True]
+
+        def connect(**kwargs):
+            if not plugged[0]:
+                raise OSError('No such device.')
+            ports.append(self._emulator.connect(**kwargs))
+            return ports[-1]
+
+        synth = SynthHD(self.DEVPATH, model=self.MODEL, reconnect=True, serial_factory=connect)
+        synth[1].frequency = 2.e9
+        synth[1].power = -5.
+        synth[0].frequency = 1.e9
+        synth.reference_mode = 'internal 10mhz'
+        # Unplug: the handle is dead and the device loses its state
+        ports[-1].close()
+        self._emulator.state.clear()
+        self.assertEqual(synth[0].power, 0.)
+        self.assertEqual(synth.reconnects, 1)
+        self.assertEqual(self._emulator.get('frequency', channel=1), 2000.)
+        self.assertEqual(self._emulator.get('power', channel=1), -5.)
+        self.assertEqual(self._emulator.get('frequency', channel=0), 1000.)
+        self.assertEqual(synth.reference_mode, 'internal 10mhz')
+        # Writes of a batch are replayed
+        with synth.batch():
+            synth[1].power = -6.
+            ports[-1].close()
+        self.assertEqual(synth.reconnects, 2)
+        self.assertEqual(self._emulator.get('power', channel=1), -6.)
+        # The device does not come back
+        synth.reconnect_timeout = .3
+        ports[-1].close()
+        plugged[0] = False
+        with self.assertRaises(ConnectionError):
+            synth[0].frequency = 1.1e9
+
+    def test_record_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'session.jsonl')
+            synth = SynthHD(self.DEVPATH, serial_factory=Recorder(path, self._emulator.connect))
+            synth[1].frequency = 2.e9
+            recorded = (synth.model, synth[1].frequency, synth.temperature)
+            synth.close()
+            replayer = Replayer(path, speed=None, strict=True)
+            synth = SynthHD('replay', serial_factory=replayer)
+            synth[1].frequency = 2.e9
+            self.assertEqual((synth.model, synth[1].frequency, synth.temperature), recorded)
+            self.assertEqual(replayer.remaining, 0)
+            replayer.strict = False
+            with self.assertRaises(TimeoutError):
+                synth.temperature
+            synth.close()
+            # Replay with the recorded timing, a different driver request fails strictly
+            synth = SynthHD('replay', serial_factory=Replayer(path, strict=True))
+            with self.assertRaises(ValueError):
+                synth[1].frequency = 3.e9
+            synth.close()
+
+    def test_instrumentation_bytes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'session.jsonl')
+            synth = SynthHD(self.DEVPATH, model=self.MODEL,
+                            serial_factory=Recorder(path, self._emulator.connect))
+            synth.instrument()
+            synth[0].frequency = 1.e9
+            synth[1].frequency = 2.e9
+            synth[0].power
+            synth[1].read_many(('power',), ('frequency',))
+            synth.read_many(('temperature',), ('reference_mode',))
+            stats = synth.stats()
+            synth.close()
+            with open(path) as file:
+                sent = sum(len(event.get('w', '')) for event in map(json.loads, file))
+        self.assertEqual(stats['total']['bytes_out'], sent)
+        self.assertEqual(stats['channel']['writes'], 4)
+
+    def test_async_lost_response(self):
+        async def run():
+            async with AsyncSynthHD('emulator', timeout=.2,
+                                    serial_factory=self._emulator.connect) as synth:
+                self._emulator.drop_responses = 1
+                with self.assertRaises(TimeoutError):
+                    await synth.get_temperature()
+                for _ in range(3):
+                    self.assertEqual(await synth.get_temperature(),
+                                     self._emulator.get('temperature'))
+        asyncio.run(run())
+
+    def test_async_tables(self):
+        async def run():
+            async with AsyncSynthHD('emulator', serial_factory=self._emulator.connect) as synth:
+                channel = synth[1]
+                f_range = channel.frequency_range
+                table = {'frequency': [f_range['start'] + 1.e6 * row for row in range(10)],
+                         'power': [-20. + row for row in range(10)]}
+                await channel.set_sweep_table(table)
+                read = await channel.get_sweep_table()
+                self.assertEqual(list(read['frequency']), table['frequency'])
+                self.assertEqual(list(read['power']), table['power'])
+                await channel.set_am_table([-10.] * 5)
+                self.assertEqual(list(await channel.get_am_table())[:5], [-10.] * 5)
+                with self.assertRaises(ValueError):
+                    await channel.set_am_table([100.])
+                with self.assertRaises(ValueError):
+                    await channel.set_frequency(f_range['stop'] * 2)
+                with self.assertRaises(ValueError):
+                    await synth.set_trigger_mode('invalid')
+                await synth.set_sweep_enable(True)
+                self.assertTrue(await synth.get_sweep_enable())
+        asyncio.run(run())
+
+    def test_async_programs(self):
+        async def run():
+            async with AsyncSynthHD('emulator', serial_factory=self._emulator.connect) as synth:
+                channel = synth[1]
+                f_start = channel.frequency_range['start']
+                sweep = Sweep(channel, f_start, f_start + 10.e6, 1.e6, time_step=4.,
+                              power_start=-10.)
+                self.assertEqual(await sweep.start(), 8)
+                self.assertTrue(await synth.get_sweep_enable())
+                await sweep.stop()
+                self.assertFalse(await synth.get_sweep_enable())
+                program = PulseProgram(channel, on_time=10, off_time=90)
+                await program.fire()
+                commands = self._emulator.commands
+                await program.fire()
+                self.assertEqual(self._emulator.commands - commands, 1)
+                self.assertEqual(await channel.read('pulse_on_time'), 10)
+        asyncio.run(run())
+
+    def test_async_record_replay(self):
+        async def run(serial_factory):
+            async with AsyncSynthHD('emulator', serial_factory=serial_factory) as synth:
+                await synth[1].set_frequency(2.e9)
+                return synth.model, await synth[1].get_frequency()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'session.jsonl')
+            recorded = asyncio.run(run(Recorder(path, self._emulator.connect)))
+            self.assertEqual(recorded, (self.MODEL, 2.e9))
+            replayer = Replayer(path, speed=None, strict=True)
+            self.assertEqual(asyncio.run(run(replayer)), recorded)
+            self.assertEqual(replayer.remaining, 0)
+
+    def test_emulator_channel_state(self):
+        self._dut[0].frequency = 1.e9
+        self._dut[1].frequency = 2.e9
+        self.assertEqual(self._emulator.get('frequency', channel=0), 1000.)
+        self.assertEqual(self._emulator.get('frequency', channel=1), 2000.)
+        self._dut.write('am_lookup_table', 7, -12.5)
+        self.assertEqual(self._dut.read('am_lookup_table', 7), -12.5)
+
+    def test_registry(self):
+        synth = SynthHD.get(self.DEVPATH, serial_factory=self._emulator.connect)
+        commands = self._emulator.commands
+        with SynthHD.get(self.DEVPATH) as other:
+            self.assertIs(other, synth)
+            self.assertEqual(self._emulator.commands, commands)
+        self.assertIsNotNone(synth._dev)
+        synth.release()
+        self.assertIsNone(synth._dev)
+        with SynthHD.get(self.DEVPATH) as other:
+            self.assertIs(other, synth)
+            self.assertEqual(self._emulator.commands, commands)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                temperatures = list(executor.map(lambda _: other.temperature, range(100)))
+            self.assertEqual(temperatures, [self._emulator.get('temperature')] * 100)
+        self.assertIsNone(synth._dev)
+
+    def test_fleet(self):
+        emulators = {'emulator0': self._emulator, 'emulator1': SynthHDEmulator(self.MODEL)}
+        def connect(port=None, **kwargs):
+            sleep(.2)
+            if port not in emulators:
+                raise OSError('No such device: {}'.format(port))
+            return emulators[port].connect(port=port, **kwargs)
+        start = monotonic()
+        fleet = SynthHDFleet([*emulators, 'missing'], model=self.MODEL, serial_factory=connect)
+        with fleet:
+            # Opened in parallel
+            self.assertLess(monotonic() - start, .4)
+            self.assertEqual(sorted(fleet), sorted(emulators))
+            self.assertEqual(list(fleet.open_errors), ['missing'])
+            self.assertIsInstance(fleet.open_errors['missing'], OSError)
+            self.assertEqual(fleet.init().errors, {})
+            frequencies = {'emulator0': 1.e9, 'emulator1': 2.e9}
+            self.assertEqual(fleet.set_frequency(frequencies, channel=1).errors, {})
+            for devpath, emulator in emulators.items():
+                self.assertEqual(emulator.get('frequency', channel=1), frequencies[devpath] / 1e6)
+            results, errors = fleet.map(lambda synth, index: synth[index].frequency, 1)
+            self.assertEqual((results, errors), (frequencies, {}))
+            # Errors are per device
+            results, errors = fleet.set_power({'emulator0': self.NOMINAL_POWER})
+            self.assertEqual(list(results), ['emulator0'])
+            self.assertIsInstance(errors['emulator1'], KeyError)
+            devices = list(fleet.values())
+        self.assertEqual(len(fleet), 0)
+        for device in devices:
+            self.assertIsNone(device._dev)
+        fleet.close()
+        # Construction failing before the thread pool exists
+        with mock.patch('sys.unraisablehook') as hook:
+            with self.assertRaises(ValueError):
+                SynthHDFleet(list(emulators), max_workers=-1)
+            gc.collect()
+        hook.assert_not_called()
+
+    def test_discover(self):
+        # A port that never answers
+        master, slave = os.openpty()
+        try:
+            found = discover([self.DEVPATH, os.ttyname(slave), os.devnull], timeout=.05)
+        finally:
+            os.close(slave)
+            os.close(master)
+        self.assertEqual(list(found), [self.DEVPATH])
+        info = found[self.DEVPATH]
+        self.assertEqual(info.model, self.MODEL)
+        self.assertEqual(info.serial_number, self._emulator.serial_number)
+        self.assertEqual(info.firmware_version, self._dut.firmware_version)
+        # USB ports are identified once per USB path
+        port = ListPortInfo(self.DEVPATH)
+        port.vid, port.pid = next(iter(USB_IDS))
+        port.location = '1-1:1.0'
+        self.assertEqual(discover([port])[self.DEVPATH].location, port.location)
+        commands = self._emulator.commands
+        self.assertIn(self.DEVPATH, discover([port]))
+        self.assertEqual(self._emulator.commands, commands)
+        discover([port], refresh=True)
+        self.assertGreater(self._emulator.commands, commands)
+
+    def test_discover_in_use(self):
+        with SynthHD.get(self.DEVPATH, serial_factory=self._emulator.connect):
+            commands = self._emulator.commands
+            self.assertEqual(discover([self.DEVPATH], timeout=.05), {})
+            self.assertEqual(self._emulator.commands, commands)
+        with Serial(self.DEVPATH, exclusive=True):
+            self.assertEqual(discover([self.DEVPATH], timeout=.05), {})
+        self.assertEqual(self._emulator.commands, commands)
+        self.assertIn(self.DEVPATH, discover([self.DEVPATH], timeout=.05))
+
+    def test_verify_mismatch(self):
+        self._dut.verify_later = True
+        try:
+            self._dut[1].frequency = 2.e9
+            self._dut[0].power = 1.
+            self._emulator.state[(1, 'frequency')] = 2100.
+            with self.assertRaises(VerificationError) as context:
+                self._dut.verify()
+            self.assertEqual(context.exception.mismatches, {(1, 'frequency'): (2000., 2100.)})
+            self.assertEqual(self._dut._channel, 0)
+            self._dut.verify()
+        finally:
+            self._dut.verify_later = False
+
+
+class SynthHDv1p4EmulatorTestCase(SynthHDEmulatorTestCase, unittest.TestCase,
+                                  SynthHDBaseTestCase):
+
+    MODEL = 'SynthHD v1.4'
+
+
+class SynthHDv2EmulatorTestCase(SynthHDEmulatorTestCase, unittest.TestCase,
+                                SynthHDv2BaseTestCase):
+
+    MODEL = 'SynthHD v2'
+
+
+class SynthHDPROv2EmulatorTestCase(SynthHDEmulatorTestCase, unittest.TestCase,
+                                   SynthHDv2BaseTestCase):
+
+    MODEL = 'SynthHD PRO v2'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 This module contains unit-tests for the SynthHD object specific to SynthHD PRO v2.
 """
 
+import os
 import sys
 import unittest
 from test_synthhd_base import SynthHDv2BaseTestCase
@@ -12,6 +13,8 @@ from windfreak import SynthHD
 class SynthHDPROv2TestCase(unittest.TestCase, SynthHDv2BaseTestCase):
 
     def setUp(self):
+        if not os.path.exists(self.DEVPATH):
+            self.skipTest('No device at {}.'.format(self.DEVPATH))
         self._dut = SynthHD(self.DEVPATH)
         self._dut.init()
 
@@ -3,6 +3,7 @@
 This module contains unit-tests for the SynthHD object specific to SynthHD v1.4.
 """
 
+import os
 import sys
 import unittest
 from test_synthhd_base import SynthHDBaseTestCase
@@ -12,6 +13,8 @@ from windfreak import SynthHD
 class SynthHDv1p4TestCase(unittest.TestCase, SynthHDBaseTestCase):
 
     def setUp(self):
+        if not os.path.exists(self.DEVPATH):
+            self.skipTest('No device at {}.'.format(self.DEVPATH))
         self._dut = SynthHD(self.DEVPATH)
         self._dut.init()
 
@@ -1,3 +1,11 @@
 __version__ = '0.3.0'
 
-from .synth_hd import SynthHD
\ No newline at end of file
+from .device import VerificationError
+from .state import SynthHDState
+from .presets import PresetStore
+from .synth_hd import SynthHD, AsyncSynthHD
+from .discovery import discover, DeviceInfo
+from .fleet import SynthHDFleet, FleetResult
+from .sweep import Sweep
+from .pulse import PulseProgram
+from .hopping import Hopper
@@ -1,75 +1,1167 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from math import ceil, log2
+from string import Formatter
+from threading import Lock, get_ident
+from time import monotonic, sleep
 from serial import Serial
+from .instrumentation import Instrumentation
+
+
+@lru_cache(maxsize=None)
+def _format_specs(request):
+    """Format specs of the replacement fields in a request string."""
+    return tuple(spec for _, field, spec, _ in Formatter().parse(request)
+                 if field is not None)
+
+
+def _parse_response(dtype, ret):
+    """Convert a response to its API data-type.
+
+    Args:
+        dtype (type): API data-type
+        ret (str): response
+
+    Returns:
+        value
+    """
+    if dtype is bool:
+        ret = int(ret)
+        if ret not in (0, 1):
+            raise ValueError('Invalid return value \'{}\' for type bool.'.format(ret))
+    return dtype(ret)
+
+
+def _encoder(request, converters, message):
+    """Compile a request string into a function of the arguments.
+
+    Args:
+        request (str): request string, None if not supported
+        converters (tuple): argument conversion per replacement field
+        message (str): error message for a wrong number of arguments
+
+    Returns:
+        callable: encode(args) -> (converted args, request bytes, text of
+            the last argument or None)
+    """
+    if request is None:
+        def encode(args):
+            raise ValueError('Request is not supported.')
+        return encode
+    literals = [literal for literal, _, _, _ in Formatter().parse(request)]
+    specs = _format_specs(request)
+    if len(specs) != len(converters):
+        raise ValueError('Request \'{}\' does not match its data-types.'.format(request))
+    if not converters:
+        data = request.encode('utf-8')
+        def encode(args):
+            if args:
+                raise ValueError(message)
+            return (), data, None
+    elif len(converters) == 1:
+        convert, = converters
+        spec, = specs
+        prefix = literals[0]
+        suffix = literals[1] if len(literals) > 1 else ''
+        def encode(args):
+            if len(args) != 1:
+                raise ValueError(message)
+            arg = convert(args[0])
+            text = format(arg, spec)
+            return (arg,), (prefix + text + suffix).encode('utf-8'), text
+    else:
+        # Each field is formatted once, between the precomputed literals
+        prefixes = literals[:len(specs)]
+        suffix = literals[len(specs)] if len(literals) > len(specs) else ''
+        if len(converters) == 2:
+            # Indexed attributes, e.g. lookup table rows
+            convert0, convert1 = converters
+            spec0, spec1 = specs
+            prefix0, prefix1 = prefixes
+            def encode(args):
+                if len(args) != 2:
+                    raise ValueError(message)
+                arg0, arg1 = convert0(args[0]), convert1(args[1])
+                text = format(arg1, spec1)
+                data = prefix0 + format(arg0, spec0) + prefix1 + text + suffix
+                return (arg0, arg1), data.encode('utf-8'), text
+        else:
+            fields = tuple(zip(prefixes, converters, specs))
+            def encode(args):
+                if len(args) != len(fields):
+                    raise ValueError(message)
+                converted, parts = [], []
+                for (prefix, convert, spec), arg in zip(fields, args):
+                    arg = convert(arg)
+                    text = format(arg, spec)
+                    converted.append(arg)
+                    parts += (prefix, text)
+                parts.append(suffix)
+                return tuple(converted), ''.join(parts).encode('utf-8'), text
+    return encode
+
+
+class _Command:
+    """API table entry compiled into encoder and decoder callables."""
+
+    __slots__ = ('encode_write', 'encode_read', 'round', 'normalize', 'parse')
+
+    def __init__(self, dtype, write, read):
+        dtype = dtype if isinstance(dtype, tuple) else (dtype,)
+        converters = tuple(int if dt is bool else dt for dt in dtype)
+        self.encode_write = _encoder(
+            write, converters, 'Number of arguments and data-types are not equal.')
+        self.encode_read = _encoder(
+            read, converters[:-1], 'Must have +1 more data-type than argument.')
+        self.round = None
+        self.normalize = None
+        self.parse = None
+        if dtype:
+            vtype = dtype[-1]
+            # The value as the device will round it, from the formatted text
+            self.round = round_ = (lambda text: bool(int(text))) if vtype is bool else vtype
+            self.parse = lambda ret: _parse_response(vtype, ret)
+            if write is not None and read is not None:
+                # A read value rounded as if written, for comparison
+                convert, spec = converters[-1], _format_specs(write)[-1]
+                self.normalize = lambda value: round_(format(convert(value), spec))
+
+
+class VerificationError(RuntimeError):
+    """Read back values do not match the values written.
+
+    Attributes:
+        mismatches (dict): (written, read) values by state key of
+            (scope, attribute, *args)
+    """
+
+    def __init__(self, mismatches):
+        self.mismatches = mismatches
+        super().__init__('Read back does not match write for {}.'.format(', '.join(
+            '{} (wrote {!r}, read {!r})'.format(key[1:] if len(key) > 2 else key[1], *values)
+            for key, values in mismatches.items())))
+
+
+class _FairLock:
+    """Reentrant lock granted to waiting threads in order of arrival.
+
+    Threads sharing a device take turns per operation instead of one thread
+    re-acquiring the lock ahead of threads that have been waiting. An
+    uncontended acquire only takes the underlying lock.
+    """
+
+    def __init__(self):
+        self._lock = Lock()   # Held while owned, handed over to waiters
+        self._mutex = Lock()  # Guards the hand over
+        self._owner = None
+        self._count = 0
+        self._waiters = deque()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def acquire(self):
+        ident = get_ident()
+        if self._owner == ident:
+            self._count += 1
+            return
+        # The lock is only free when no thread is waiting
+        if not self._lock.acquire(False):
+            with self._mutex:
+                waiter = None
+                if not self._lock.acquire(False):
+                    waiter = Lock()
+                    waiter.acquire()
+                    self._waiters.append(waiter)
+            if waiter is not None:
+                # Released once the lock has been handed over
+                waiter.acquire()
+        self._owner = ident
+        self._count = 1
+
+    def release(self):
+        if self._owner != get_ident():
+            raise RuntimeError('Cannot release un-acquired lock.')
+        self._count -= 1
+        if self._count:
+            return
+        self._owner = None
+        with self._mutex:
+            if self._waiters:
+                self._waiters.popleft().release()
+            else:
+                self._lock.release()
+
+
+def _locked(method):
+    """Run a method holding the device I/O lock.
+
+    The lock is only acquired if the calling thread does not hold it yet,
+    e.g. within a transaction. In reconnect mode an I/O error, other than a
+    timeout, reconnects the device and the method is run once more. Only the
+    outermost locked call is retried.
+    """
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        lock = self._lock
+        owned = lock._owner == get_ident()
+        if not owned:
+            lock.acquire()
+        try:
+            if not self.reconnect or self._depth:
+                return method(self, *args, **kwargs)
+            self._depth += 1
+            try:
+                try:
+                    return method(self, *args, **kwargs)
+                except OSError as exc:
+                    if isinstance(exc, TimeoutError) or self._dev is None:
+                        raise
+                    self._reconnect(exc)
+                return method(self, *args, **kwargs)
+            finally:
+                self._depth -= 1
+        finally:
+            if not owned:
+                lock.release()
+    return locked
+
+
+class _CommandTable(dict):
+    """Commands compiled from an API table on first use."""
+
+    def __init__(self, api):
+        super().__init__()
+        self._api = api
+
+    def __missing__(self, attribute):
+        command = self[attribute] = _Command(*self._api[attribute])
+        return command
+
+
+_command_tables = {}
+
+
+def _command_table(api):
+    """Shared compiled command table of an API table."""
+    table = _command_tables.get(id(api))
+    if table is None or table._api is not api:
+        table = _command_tables[id(api)] = _CommandTable(api)
+    return table
+
+
+def _registry_path(devpath):
+    """Key of a device path in SerialDevice._registry, resolving links."""
+    return os.path.realpath(devpath) if os.path.exists(devpath) else devpath
 
 
 class SerialDevice:
 
-    def __init__(self, devpath):
+    # Seconds a cached attribute value stays valid. Attributes not listed
+    # never expire, a TTL of 0 disables caching for the attribute.
+    CACHE_TTL = {}
+
+    # Seconds to wait for the response to an attribute, in place of the
+    # device timeout. For a write-only attribute, e.g. one that makes the
+    # device busy, the time is added to the deadline of the next response.
+    TIMEOUTS = {}
+
+    # Lower bound of adaptive response deadlines in seconds
+    MIN_TIMEOUT = .1
+
+    # Seconds between reconnect attempts, doubling up to the maximum
+    RECONNECT_DELAY = .1
+    RECONNECT_MAX_DELAY = 2.
+
+    # Shared devices handed out by get(), by class and device path
+    _registry = {}
+    _registry_lock = Lock()
+
+    def __init__(self, devpath, cache=False, dirty_only=False, verify_later=False,
+                 timeout=10., adaptive_timeout=False, reconnect=False,
+                 reconnect_timeout=30., serial_factory=Serial):
+        """Open device.
+
+        Args:
+            devpath (str): serial device path
+            cache (bool): serve reads from the state written or last read
+                by this object, see `cache_ttl` and `refresh()`
+            dirty_only (bool): suppress writes of values equal to the known
+                state, counted in `suppressed_writes`
+            verify_later (bool): record written attributes for read back by
+                `verify()`
+            timeout (float): seconds to wait for a response, see `timeouts`
+                for per-attribute policies
+            adaptive_timeout (bool): wait for a response only a few times
+                the observed round-trip time, at least MIN_TIMEOUT and at
+                most timeout
+            reconnect (bool): on an I/O error, e.g. a USB disconnect, reopen
+                the port and write the configuration written so far again,
+                then retry the operation. Paths such as /dev/serial/by-id/...
+                survive the device re-enumerating.
+            reconnect_timeout (float): seconds to keep trying to reconnect
+            serial_factory (callable): called as serial_factory(port=devpath,
+                timeout=...) to open the port, e.g. an emulator in place of
+                serial.Serial
+        """
         self._devpath = devpath
         self._dev = None
+        self._lock = _FairLock()
+        self._refs = 0
+        self._serial_factory = serial_factory
+        self._commands = _command_table(self.API)
+        self._batch = None
+        self._state = {}
+        self.cache = cache
+        self.cache_ttl = dict(self.CACHE_TTL)
+        self.dirty_only = dirty_only
+        self.suppressed_writes = 0
+        self._touched = {} if verify_later else None
+        self.timeout = timeout
+        self.timeouts = dict(self.TIMEOUTS)
+        self.adaptive_timeout = adaptive_timeout
+        self._port_timeout = None
+        self._late = 0
+        self._rtt = None
+        self._rtt_var = 0.
+        self._busy_until = 0.
+        self.reconnect = reconnect
+        self.reconnect_timeout = reconnect_timeout
+        self.reconnects = 0
+        self._tracked = {}
+        self._depth = 0
+        self._instrumentation = None
         self.open()
 
     def __del__(self):
-        self.close()
+        # Construction may have failed before the port was opened
+        if getattr(self, '_dev', None) is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @classmethod
+    def get(cls, devpath, **kwargs):
+        """Shared device for a device path, one per process.
+
+        The device is constructed on first use and reference counted. Every
+        call must be paired with a `release()`, e.g. by using the device as
+        a context manager. When the last reference is released the port is
+        closed but the object is kept, so that a later get only reopens the
+        port. Operations from concurrent threads are serialized.
+
+        Args:
+            devpath (str): serial device path
+            **kwargs: constructor keyword arguments, used on first use only
+
+        Returns:
+            SerialDevice: shared device
+        """
+        path = _registry_path(devpath)
+        with cls._registry_lock:
+            device = cls._registry.get((cls, path))
+            if device is None:
+                device = cls._registry[(cls, path)] = cls(devpath, **kwargs)
+            elif device._dev is None:
+                device.open()
+            device._refs += 1
+            return device
+
+    def release(self):
+        """Drop a reference from `get()`. Closes the port on the last one.
+
+        A device not obtained from `get()` is closed.
+        """
+        with self._registry_lock:
+            if self._refs > 0:
+                self._refs -= 1
+            if self._refs == 0:
+                self.close()
 
     def open(self):
-        if self._dev is not None:
-            raise RuntimeError('Device has already been opened.')
-        self._dev = Serial(port=self._devpath, timeout=10)
+        with self._lock:
+            if self._dev is not None:
+                raise RuntimeError('Device has already been opened.')
+            self._dev = self._serial_factory(port=self._devpath, timeout=self.timeout)
+            self._port_timeout = self.timeout
+            self._late = 0
+            self._invalidate()
 
     def close(self):
-        if self._dev is not None:
-            self._dev.close()
-            self._dev = None
+        with self._lock:
+            if self._dev is not None:
+                self._batch = None
+                try:
+                    self._dev.close()
+                finally:
+                    self._dev = None
+                    self._invalidate()
+
+    def instrument(self, enable=True, trace=False):
+        """Start or stop collecting I/O statistics.
+
+        Args:
+            enable (bool): collect, a running collection is replaced
+            trace (bool): keep events for Instrumentation.export_trace
+
+        Returns:
+            Instrumentation: collection, None if disabled
+        """
+        self._instrumentation = Instrumentation(trace=trace) if enable else None
+        return self._instrumentation
+
+    @property
+    def instrumentation(self):
+        """I/O statistics collection, see `instrument()`.
+
+        Returns:
+            Instrumentation: collection or None if disabled
+        """
+        return self._instrumentation
+
+    def stats(self):
+        """I/O statistics by attribute, see Instrumentation.stats.
+
+        Returns:
+            dict: statistics, empty if not instrumented
+        """
+        return {} if self._instrumentation is None else self._instrumentation.stats()
+
+    @_locked
+    def _scoped(self, scope, method, *args):
+        """Direct requests to a scope and call a method, as one operation.
+
+        Args:
+            scope (hashable): scope, e.g. channel index
+            method (callable): called as method(*args)
+
+        Returns:
+            return value of method
+        """
+        self._set_scope(scope)
+        return method(*args)
+
+    @contextmanager
+    def transaction(self):
+        """Hold the device for a sequence of operations.
+
+        Requests from other threads are not interleaved with those made
+        within the transaction, e.g. between a channel select and the command
+        that follows. Threads waiting for the device are served in order.
+        """
+        with self._lock:
+            yield self
+
+    @property
+    def verify_later(self):
+        """Record written attributes for read back by `verify()`.
+
+        Returns:
+            bool: enable
+        """
+        return self._touched is not None
+
+    @verify_later.setter
+    def verify_later(self, value):
+        if not isinstance(value, bool):
+            raise ValueError('Expected bool.')
+        if value != self.verify_later:
+            self._touched = {} if value else None
 
+    @contextmanager
+    def batch(self, verify=False):
+        """Collect writes and send them to the device in a single transfer.
+
+        Reads within the batch flush the pending writes first. Batches may be
+        nested, pending writes are flushed when the outermost batch exits.
+
+        Args:
+            verify (bool): read back the attributes written, see `verify()`,
+                when the batch exits
+        """
+        with self._lock:
+            track = verify and self._touched is None
+            if track:
+                self._touched = {}
+            try:
+                if self._batch is not None:
+                    yield self
+                else:
+                    self._batch = []
+                    try:
+                        yield self
+                    finally:
+                        try:
+                            self._flush()
+                        except OSError as exc:
+                            # The tracked state replayed on reconnect includes
+                            # the writes of the batch
+                            if (not self.reconnect or self._depth or self._dev is None
+                                    or isinstance(exc, TimeoutError)):
+                                raise
+                            self._reconnect(exc)
+                        finally:
+                            self._batch = None
+                if verify:
+                    self.verify()
+            finally:
+                if track:
+                    self._touched = None
+
+    @_locked
+    def verify(self):
+        """Read back the attributes written since the last verification.
+
+        The queries are pipelined and bypass the cache. Attributes the device
+        changes by itself, i.e. with a cache TTL of 0, are not verified.
+
+        Raises:
+            VerificationError: read back values differ from written values
+        """
+        if not self._touched:
+            return
+        touched = self._touched
+        self._touched = {}
+        cache, self.cache = self.cache, False
+        try:
+            values = self._read_keys(list(touched))
+        finally:
+            self.cache = cache
+        mismatches = {}
+        for (key, expected), value in zip(touched.items(), values):
+            if self._commands[key[1]].normalize(value) != expected:
+                mismatches[key] = (expected, value)
+        if mismatches:
+            raise VerificationError(mismatches)
+
+    @_locked
+    def refresh(self, *attributes):
+        """Discard cached state so that the next reads query the device.
+
+        Args:
+            *attributes (str): attributes to discard, all if none are given
+        """
+        if not attributes:
+            self._state.clear()
+            return
+        for key in [key for key in self._state if key[1] in attributes]:
+            del self._state[key]
+
+    @_locked
     def write(self, attribute, *args):
-        dtype, request, _ = self.API[attribute]
-        dtype = dtype if isinstance(dtype, tuple) else (dtype,)
-        if len(args) != len(dtype):
-            raise ValueError('Number of arguments and data-types are not equal.')
-        args = ((int(ar) if dt is bool else dt(ar)) for dt, ar in zip(dtype, args))
-        self._write(request.format(*args))
+        self._write_attribute(attribute, args, self.dirty_only)
 
+    @_locked
+    def write_changed(self, attribute, *args):
+        """Write unless the value equals the known state, as in dirty-only mode.
+
+        Returns:
+            bool: True if written, False if suppressed
+        """
+        return self._write_attribute(attribute, args, True)
+
+    @_locked
     def read(self, attribute, *args):
-        dtype, _, request = self.API[attribute]
-        dtype = dtype if isinstance(dtype, tuple) else (dtype,)
-        if len(args) + 1 != len(dtype):
-            raise ValueError('Must have +1 more data-type than argument.')
-        args = ((int(ar) if dt is bool else dt(ar)) for dt, ar in zip(dtype, args))
-        ret = self._query(request.format(*args))
-        dtype = dtype[-1]
-        if dtype is bool:
-            ret = int(ret)
-            if ret not in (0, 1):
-                raise ValueError('Invalid return value \'{}\' for type bool.'.format(ret))
-        return dtype(ret)
+        return self._read_attribute(attribute, args)
+
+    def _read_attribute(self, attribute, args):
+        key, command, preamble, data = self._read_request(attribute, args)
+        if data is None:
+            return self._state[key][0]
+        inst = self._instrumentation
+        if inst is not None:
+            start = monotonic()
+        try:
+            ret = self._query(preamble + data, attribute)
+        except Exception as exc:
+            self._invalidate()
+            if inst is not None:
+                inst.record('read', attribute, start, monotonic() - start, len(data), 0, exc)
+            raise
+        if inst is not None:
+            inst.record('read', attribute, start, monotonic() - start, len(data), len(ret) + 1)
+        return self._read_response(key, command, ret)
+
+    def encode(self, attribute, *args):
+        """Encode a write request without sending it.
+
+        Returns:
+            bytes: request, e.g. for write_raw
+        """
+        return self._commands[attribute].encode_write(args)[1]
+
+    @_locked
+    def write_raw(self, data):
+        """Write pre-encoded requests, e.g. from encode.
+
+        The device state assumed by this object, including the cache, is
+        discarded since the requests are not interpreted.
+
+        Args:
+            data (bytes): requests
+        """
+        self._invalidate()
+        inst = self._instrumentation
+        if inst is not None:
+            start = monotonic()
+        try:
+            self._write(data)
+        except Exception as exc:
+            self._invalidate()
+            if inst is not None:
+                inst.record('write', '<raw>', start, monotonic() - start, len(data), 0, exc)
+            raise
+        if inst is not None:
+            inst.record('write', '<raw>', start, monotonic() - start, len(data))
+
+    @_locked
+    def read_many(self, *requests):
+        """Read several attributes, pipelining the queries in one write.
+
+        Args:
+            *requests (tuple): (attribute, *args) per read
+
+        Returns:
+            list: values in order of the requests
+        """
+        return self._read_many(requests)
+
+    def _read_many(self, requests):
+        values = [None] * len(requests)
+        queries, indices = [], []
+        try:
+            for index, (attribute, *args) in enumerate(requests):
+                key, command, preamble, data = self._read_request(attribute, args)
+                if data is None:
+                    values[index] = self._state[key][0]
+                else:
+                    queries.append((key, command, preamble, data))
+                    indices.append(index)
+            rets = self._pipeline(queries) if queries else []
+        except Exception:
+            self._invalidate()
+            raise
+        for index, (key, command, _, _), ret in zip(indices, queries, rets):
+            values[index] = self._read_response(key, command, ret)
+        return values
+
+    def _read_keys(self, keys):
+        """Read the values of state keys, pipelining the queries in one write.
+
+        Args:
+            keys (list): state keys of (scope, attribute, *args)
+
+        Returns:
+            list: values in order of the keys
+        """
+        values = [None] * len(keys)
+        queries, indices = [], []
+        try:
+            for index, key in enumerate(keys):
+                previous = self._set_scope(key[0])
+                key, command, preamble, data = self._read_request(key[1], key[2:])
+                self._set_scope(previous)
+                if data is None:
+                    values[index] = self._state[key][0]
+                else:
+                    queries.append((key, command, preamble, data))
+                    indices.append(index)
+            rets = self._pipeline(queries) if queries else []
+        except Exception:
+            self._invalidate()
+            raise
+        for index, (key, command, _, _), ret in zip(indices, queries, rets):
+            values[index] = self._read_response(key, command, ret)
+        return values
+
+    def _pipeline(self, queries):
+        """Send read requests in a single write and read their responses.
+
+        Args:
+            queries (list): (state key, command, preamble, request data) per read
+
+        Returns:
+            list: responses in order of the queries
+        """
+        inst = self._instrumentation
+        if inst is not None:
+            start = monotonic()
+        if self._late:
+            self._resync()
+        self._write(b''.join([preamble + data for _, _, preamble, data in queries]))
+        rets = []
+        for key, _, _, data in queries:
+            try:
+                rets.append(self._read(key[1]))
+            except Exception as exc:
+                if isinstance(exc, TimeoutError):
+                    # The responses to the queries after it are outstanding too
+                    self._late += len(queries) - len(rets) - 1
+                if inst is not None:
+                    inst.record('read', key[1], start, monotonic() - start, len(data), 0, exc)
+                raise
+            if inst is not None:
+                inst.record('read', key[1], start, monotonic() - start, len(data),
+                            len(rets[-1]) + 1)
+        return rets
+
+    def _write_attribute(self, attribute, args, changed_only):
+        command = self._commands[attribute]
+        args, data, text = command.encode_write(args)
+        if args:
+            key = self._state_key(attribute, args[:-1])
+            value = command.round(text)
+            if changed_only and self._cached(key) == (value,):
+                self.suppressed_writes += 1
+                return False
+        # The preamble is recorded on its own, see _preamble
+        preamble = self._preamble(attribute)
+        inst = self._instrumentation
+        if inst is not None:
+            start = monotonic()
+        try:
+            self._write(preamble + data)
+        except Exception as exc:
+            self._invalidate()
+            if inst is not None:
+                inst.record('write', attribute, start, monotonic() - start, len(data), 0, exc)
+            raise
+        if inst is not None:
+            inst.record('write', attribute, start, monotonic() - start, len(data))
+        if attribute in self.timeouts:
+            self._busy_until = monotonic() + self.timeouts[attribute]
+        if args:
+            self._state[key] = (value, monotonic())
+            if self.reconnect and self.cache_ttl.get(attribute) != 0:
+                # Most recent last, the order to write again in
+                self._tracked.pop(key, None)
+                self._tracked[key] = value
+            if (self._touched is not None and command.normalize is not None
+                    and self.cache_ttl.get(attribute) != 0):
+                self._touched[key] = value
+        return True
+
+    def _read_request(self, attribute, args):
+        """Prepare a read.
+
+        Returns:
+            tuple: (state key, command, preamble, request data or None if
+                cached)
+        """
+        command = self._commands[attribute]
+        args, data, _ = command.encode_read(args)
+        key = self._state_key(attribute, args)
+        if self.cache and self._cached(key):
+            if self._instrumentation is not None:
+                self._instrumentation.record('cached', attribute, monotonic(), 0.)
+            return key, command, b'', None
+        return key, command, self._preamble(attribute), data
+
+    def _read_response(self, key, command, ret):
+        """Parse a read response and record it in the state cache."""
+        value = command.parse(ret)
+        self._state[key] = (value, monotonic())
+        return value
+
+    def _cached(self, key):
+        """Look up an unexpired value in the state cache.
+
+        Args:
+            key (tuple): state cache key
+
+        Returns:
+            tuple: (value,) or empty tuple if not cached or expired
+        """
+        if key not in self._state:
+            return ()
+        value, timestamp = self._state[key]
+        ttl = self.cache_ttl.get(key[1])
+        if ttl is None or monotonic() - timestamp < ttl:
+            return (value,)
+        return ()
+
+    def _state_key(self, attribute, args):
+        """Key of an attribute in the state cache.
+
+        Args:
+            attribute (str): attribute name
+            args (tuple): index arguments, e.g. lookup table row
+
+        Returns:
+            tuple: key of (scope, attribute, *args)
+        """
+        return (self._scope(attribute), attribute) + args
+
+    def _scope(self, attribute):
+        """Scope an attribute's value belongs to, e.g. a channel.
+
+        Args:
+            attribute (str): attribute name
+
+        Returns:
+            hashable: scope, None by default
+        """
+        return None
+
+    def _set_scope(self, scope):
+        """Direct the following requests to a scope, e.g. select a channel.
+
+        Args:
+            scope (hashable): scope, None for no change
+
+        Returns:
+            hashable: previous scope
+        """
+        return None
+
+    def _preamble(self, attribute):
+        """Commands to send ahead of the request for an attribute.
+
+        Args:
+            attribute (str): attribute name
+
+        Returns:
+            bytes: commands, empty by default
+        """
+        return b''
+
+    def _invalidate(self):
+        """Forget any assumed device state. Called on open, close and errors."""
+        self._state.clear()
 
     def _write(self, data):
-        """Write to device.
+        """Write to device. Within a batch the data is buffered instead.
 
         Args:
-            data (str): write data
+            data (bytes): write data
         """
-        self._dev.write(data.encode('utf-8'))
+        if self._batch is not None:
+            self._batch.append(data)
+        else:
+            self._dev.write(data)
+
+    def _flush(self):
+        """Send writes buffered by a batch to the device."""
+        if self._batch:
+            data = b''.join(self._batch)
+            self._batch.clear()
+            try:
+                self._dev.write(data)
+            except Exception:
+                self._invalidate()
+                raise
+
+    def _reconnect(self, exc):
+        """Reopen the port after an I/O error and replay the tracked state.
+
+        Args:
+            exc (Exception): I/O error
+
+        Raises:
+            ConnectionError: not reconnected within reconnect_timeout
+        """
+        batch = self._batch
+        delay = self.RECONNECT_DELAY
+        deadline = monotonic() + self.reconnect_timeout
+        while True:
+            self.close()
+            try:
+                self.open()
+                self._replay()
+                break
+            except OSError:
+                if monotonic() + delay > deadline:
+                    raise ConnectionError('Device did not reconnect.') from exc
+                sleep(delay)
+                delay = min(2. * delay, self.RECONNECT_MAX_DELAY)
+        self._batch = batch
+        self.reconnects += 1
+
+    def _replay(self):
+        """Write the tracked state to the device in a single transfer."""
+        data = []
+        for key, value in self._tracked.items():
+            previous = self._set_scope(key[0])
+            data.append(self._preamble(key[1])
+                        + self._commands[key[1]].encode_write(key[2:] + (value,))[1])
+            self._set_scope(previous)
+        if data:
+            self._dev.write(b''.join(data))
+        now = monotonic()
+        self._state.update((key, (value, now)) for key, value in self._tracked.items())
+
+    def _read_timeout(self, attribute):
+        """Seconds to wait for the response to a read.
 
-    def _read(self):
+        Args:
+            attribute (str): attribute name, None if unknown
+
+        Returns:
+            float: timeout
+        """
+        timeout = self.timeouts.get(attribute)
+        if timeout is None:
+            timeout = self.timeout
+            if self.adaptive_timeout and self._rtt is not None:
+                # Rounded up to a power of two so that the port is rarely reconfigured
+                rto = max(self._rtt + 4. * self._rtt_var, self.MIN_TIMEOUT)
+                timeout = min(2. ** ceil(log2(rto)), timeout)
+        busy = self._busy_until - monotonic()
+        return timeout + busy if busy > 0. else timeout
+
+    def _observe_rtt(self, rtt):
+        """Update the round-trip time estimate, as TCP does (RFC 6298)."""
+        if self._rtt is None:
+            self._rtt, self._rtt_var = rtt, rtt / 2.
+        else:
+            self._rtt_var += .25 * (abs(self._rtt - rtt) - self._rtt_var)
+            self._rtt += .125 * (rtt - self._rtt)
+
+    def _read(self, attribute=None):
         """Read from device.
 
+        Args:
+            attribute (str): attribute read, selects the timeout policy
+
         Returns:
             str: data
         """
+        self._flush()
+        timeout = self._read_timeout(attribute)
+        if timeout != self._port_timeout:
+            self._dev.timeout = self._port_timeout = timeout
+        start = monotonic()
         rdata = self._dev.readline()
         if not rdata.endswith(b'\n'):
+            # Back off, the estimate may be too low
+            self._rtt_var = max(2. * self._rtt_var, self.MIN_TIMEOUT)
+            # The response may still arrive, see _resync
+            self._late += 1
             raise TimeoutError('Expected newline terminator.')
+        # Not while busy, e.g. writing EEPROM, the delay is not a round trip
+        if attribute not in self.timeouts and start >= self._busy_until:
+            self._observe_rtt(monotonic() - start)
         return rdata.decode('utf-8').strip()
 
-    def _query(self, data):
+    def _query(self, data, attribute=None):
         """Write to device and read response.
 
         Args:
-            data (str): write data
+            data (bytes): write data
+            attribute (str): attribute read, selects the timeout policy
+
+        Returns:
+            str: data
+        """
+        if self._late:
+            self._resync()
+        self._write(data)
+        return self._read(attribute)
+
+    def _resync(self):
+        """Read the late responses to timed out reads.
+
+        Otherwise a late response would be taken for that of the next query.
+        A response that does not arrive within the full timeout is assumed
+        lost.
+        """
+        late, self._late = self._late, 0
+        busy = self._busy_until - monotonic()
+        timeout = self.timeout + busy if busy > 0. else self.timeout
+        if timeout != self._port_timeout:
+            self._dev.timeout = self._port_timeout = timeout
+        for _ in range(late):
+            if not self._dev.readline().endswith(b'\n'):
+                break
+
+
+class AsyncSerialDevice:
+    """Serial device driven by an asyncio event loop.
+
+    Reads are non-blocking: the port is opened without timeout and read when
+    the running loop reports its file descriptor readable, so many devices
+    can be served from one loop without a thread per device. Ports without
+    a descriptor, e.g. the emulator, are read after every write. Queries may
+    be issued concurrently, responses are matched to requests in order.
+    """
+
+    # Seconds to wait for the response to an attribute, in place of timeout
+    TIMEOUTS = {}
+
+    def __init__(self, devpath, timeout=10., serial_factory=Serial):
+        """Create device. The port is opened by `open`.
+
+        Args:
+            devpath (str): serial device path
+            timeout (float): seconds to wait for a response
+            serial_factory (callable): called as serial_factory(port=devpath,
+                timeout=0) to open the port, e.g. an emulator or a Recorder
+        """
+        self._devpath = devpath
+        self._dev = None
+        self._serial_factory = serial_factory
+        self._loop = None
+        self._fd = None
+        self._commands = _command_table(self.API)
+        self._buffer = b''
+        self._pending = deque()
+        self.timeout = timeout
+        self.timeouts = dict(self.TIMEOUTS)
+        # Not instrumented, for shared code such as SynthHD._preamble
+        self._instrumentation = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def open(self):
+        if self._dev is not None:
+            raise RuntimeError('Device has already been opened.')
+        self._loop = asyncio.get_running_loop()
+        self._dev = self._serial_factory(port=self._devpath, timeout=0)
+        fileno = getattr(self._dev, 'fileno', None)
+        if fileno is not None:
+            try:
+                self._fd = fileno()
+                self._loop.add_reader(self._fd, self._poll)
+            except Exception:
+                self._fd = None
+                self.close()
+                raise
+        self._invalidate()
+
+    def close(self):
+        if self._dev is not None:
+            if self._fd is not None:
+                self._loop.remove_reader(self._fd)
+                self._fd = None
+            self._dev.close()
+            self._dev = None
+            self._buffer = b''
+            self._connection_lost(None)
+            self._invalidate()
+
+    async def write(self, attribute, *args):
+        _, data, _ = self._commands[attribute].encode_write(args)
+        try:
+            self._write(self._preamble(attribute) + data)
+        except Exception:
+            self._invalidate()
+            raise
+
+    async def read(self, attribute, *args):
+        command = self._commands[attribute]
+        _, data, _ = command.encode_read(args)
+        try:
+            ret = await self._query(self._preamble(attribute) + data,
+                                    self.timeouts.get(attribute, self.timeout))
+        except Exception:
+            self._invalidate()
+            raise
+        return command.parse(ret)
+
+    def _preamble(self, attribute):
+        """Commands to send ahead of the request for an attribute.
+
+        Args:
+            attribute (str): attribute name
+
+        Returns:
+            bytes: commands, empty by default
+        """
+        return b''
+
+    def _invalidate(self):
+        """Forget any assumed device state. Called on open, close and errors."""
+        pass
+
+    def _write(self, data):
+        """Write to device.
+
+        Args:
+            data (bytes): write data
+        """
+        if self._dev is None:
+            raise RuntimeError('Device is not open.')
+        self._dev.write(data)
+        if self._fd is None:
+            # Not watched by the loop, the response may be available now
+            self._loop.call_soon(self._poll)
+
+    def _poll(self):
+        """Read the data available from the port."""
+        try:
+            while self._dev is not None:
+                data = self._dev.readline()
+                if not data:
+                    break
+                self._data_received(data)
+        except OSError as exc:
+            # E.g. the device was unplugged
+            self._connection_lost(exc)
+            self.close()
+
+    async def _query(self, data, timeout=None):
+        """Write to device and await response.
+
+        Args:
+            data (bytes): write data
+            timeout (float): seconds to wait, the device timeout by default
 
         Returns:
             str: data
         """
+        future = asyncio.get_running_loop().create_future()
         self._write(data)
-        return self._read()
+        self._pending.append(future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future),
+                                          self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self._resync()
+            raise TimeoutError('Expected newline terminator.') from None
+
+    def _resync(self):
+        """Recover the request-response order after a lost or late response.
+
+        Input received so far is discarded and every pending query fails,
+        since its response can no longer be told apart from a late one.
+        """
+        self._buffer = b''
+        if self._dev is not None:
+            self._dev.reset_input_buffer()
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(TimeoutError('Expected newline terminator.'))
+            # Retrieve the exception so that it is not reported as unhandled
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def _data_received(self, data):
+        self._buffer += data
+        while b'\n' in self._buffer:
+            line, self._buffer = self._buffer.split(b'\n', 1)
+            if self._pending:
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(line.decode('utf-8').strip())
+
+    def _connection_lost(self, exc):
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError('Device connection lost.'))
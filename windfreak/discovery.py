@@ -0,0 +1,123 @@
+from .device import SerialDevice, _command_table, _registry_path
+from .synth_hd import SynthHD, _model
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from serial import Serial
+from serial.tools.list_ports import comports
+
+
+# USB vendor and product IDs of Windfreak serial devices
+USB_IDS = frozenset((
+    (0x16d0, 0x0557),
+    (0x04d8, 0x000a),
+))
+
+DeviceInfo = namedtuple('DeviceInfo', ('devpath', 'model', 'serial_number',
+                                       'firmware_version', 'hardware_version', 'location'))
+DeviceInfo.__doc__ = """Identity of a discovered device.
+
+Attributes:
+    devpath (str): serial device path
+    model (str): model version or None if unsupported, see SynthHD.model
+    serial_number (int): serial number
+    firmware_version (str): firmware version
+    hardware_version (str): hardware version
+    location (str): USB path of the port or None
+"""
+
+# Identities by (USB path, device path) of the ports probed
+_cache = {}
+
+
+def discover(ports=None, usb_ids=USB_IDS, timeout=.2, refresh=False, serial_factory=Serial):
+    """Find and identify SynthHD devices.
+
+    Candidate ports are probed in parallel with a short timeout, ports that
+    do not answer like a SynthHD are left out. Ports in use, by a device
+    from `SerialDevice.get()` or locked by another process, are not probed,
+    so that sessions on them are not disturbed. Identities of USB ports are
+    cached by USB path, so that repeated discovery only probes ports that
+    have changed.
+
+    Args:
+        ports (iterable): device paths or serial.tools.list_ports entries,
+            all serial ports by default
+        usb_ids (set): (vendor ID, product ID) of USB ports to probe, None
+            to probe all ports. Ports given as device paths are always probed.
+        timeout (float): seconds to wait for each response
+        refresh (bool): probe all candidates, ignoring cached identities
+        serial_factory (callable): opens a port, see SerialDevice
+
+    Returns:
+        dict: DeviceInfo by device path
+    """
+    candidates = []
+    for port in comports() if ports is None else ports:
+        if isinstance(port, str):
+            candidates.append((port, None))
+        elif usb_ids is None or (port.vid, port.pid) in usb_ids:
+            candidates.append((port.device, port.location))
+    found = {}
+    probe = []
+    for devpath, location in candidates:
+        key = (location, devpath)
+        if location is not None and not refresh and key in _cache:
+            if _cache[key] is not None:
+                found[devpath] = _cache[key]
+        elif not _in_use(devpath):
+            probe.append((devpath, location))
+    if probe:
+        with ThreadPoolExecutor(max_workers=len(probe)) as executor:
+            infos = executor.map(lambda port: _probe(*port, timeout, serial_factory), probe)
+            for (devpath, location), info in zip(probe, infos):
+                if location is not None:
+                    _cache[(location, devpath)] = info
+                if info is not None:
+                    found[devpath] = info
+    return dict(sorted(found.items()))
+
+
+def _in_use(devpath):
+    """Whether a shared device has the port open, see SerialDevice.get()."""
+    path = _registry_path(devpath)
+    with SerialDevice._registry_lock:
+        return any(key[1] == path and device._dev is not None
+                   for key, device in SerialDevice._registry.items())
+
+
+def _probe(devpath, location, timeout, serial_factory):
+    """Identify the device on a port.
+
+    Returns:
+        DeviceInfo: identity or None if not a SynthHD
+    """
+    commands = _command_table(SynthHD.API)
+    try:
+        # Fails if another process holds an exclusive lock on the port
+        dev = serial_factory(port=devpath, timeout=timeout, exclusive=True)
+    except Exception:
+        return None
+    try:
+        dev.reset_input_buffer()
+
+        def query(*attributes):
+            dev.write(b''.join(commands[attribute].encode_read(())[1]
+                               for attribute in attributes))
+            values = []
+            for attribute in attributes:
+                rdata = dev.readline()
+                if not rdata.endswith(b'\n'):
+                    raise TimeoutError('Expected newline terminator.')
+                values.append(commands[attribute].parse(rdata.decode('utf-8').strip()))
+            return values
+
+        serial_number, fw_version, hw_version = query('serial_number', 'fw_version', 'hw_version')
+        if not hw_version.startswith('Hardware Version'):
+            return None
+        sub_version = query('sub_version')[0] if 'Version 2.' in hw_version else None
+    except Exception:
+        return None
+    finally:
+        dev.close()
+    return DeviceInfo(devpath, _model(hw_version, sub_version), serial_number,
+                      fw_version, hw_version, location)
@@ -0,0 +1,296 @@
+import os
+import re
+from collections import deque
+from select import select
+from threading import Lock, Thread
+from time import sleep
+from .device import _format_specs
+from .synth_hd import SynthHD
+
+
+_NUMBER = r'([-+]?(?:\d+\.?\d*|\.\d+))'
+
+
+def _compile(request):
+    """Regex matching a request string, with a group per argument."""
+    return re.compile(_NUMBER.join(re.escape(part) for part in re.split(r'\{[^}]*\}', request)))
+
+
+class SynthHDEmulatorPort:
+    """Serial port connected to a SynthHD emulator.
+
+    Implements the parts of the serial.Serial interface used by SerialDevice.
+    Responses to a write are queued until read, a read with no response
+    queued times out immediately.
+    """
+
+    def __init__(self, emulator, port=None, timeout=None, **kwargs):
+        self._emulator = emulator
+        self._responses = deque()
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    @property
+    def in_waiting(self):
+        return sum(len(line) for line in self._responses)
+
+    def reset_input_buffer(self):
+        self._responses.clear()
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError('Port is closed.')
+        data = bytes(data)
+        self._emulator._transfer(len(data))
+        self._responses.extend(self._emulator.process(data))
+        return len(data)
+
+    def readline(self):
+        if not self.is_open:
+            raise OSError('Port is closed.')
+        if not self._responses:
+            return b''
+        if self._emulator.late_responses:
+            # Time out, the response stays queued
+            self._emulator.late_responses -= 1
+            return b''
+        line = self._responses.popleft()
+        self._emulator._transfer(len(line))
+        return line
+
+
+class SynthHDEmulator:
+    """Software SynthHD speaking the command grammar of SynthHD.API.
+
+    The emulator keeps per-channel state, tracks the selected channel and
+    answers identity queries for the given model. Connect a SynthHD to it
+    in-process with `connect`:
+
+        emulator = SynthHDEmulator('SynthHD v2')
+        synth = SynthHD('emulator', serial_factory=emulator.connect)
+
+    or expose it on a pseudo-terminal for out-of-process clients with
+    `open_pty`.
+    """
+
+    IDENTITY = {
+        'SynthHD v1.4':   ('Hardware Version 1.4a', None),
+        'SynthHD v2':     ('Hardware Version 2.06', 'HD'),
+        'SynthHD PRO v2': ('Hardware Version 2.06', 'HDPRO'),
+    }
+
+    DEFAULTS = {
+        'frequency':      1000.,
+        'power':          0.,
+        'calibrated':     True,
+        'temp_comp_mode': 3,
+        'pll_lock':       True,
+        'reference_mode': 1,
+        'ref_frequency':  27.,
+        'channelspacing': 100.,
+        'temperature':    30.,
+    }
+
+    def __init__(self, model='SynthHD v2', serial_number=1000, byte_time=0.):
+        """Create emulator.
+
+        Args:
+            model (str): emulated model, key of IDENTITY
+            serial_number (int): emulated serial number
+            byte_time (float): seconds to transfer one byte in either
+                direction, 0 for no delay
+        """
+        if model not in self.IDENTITY:
+            raise ValueError('Expected model in set {}.'.format(tuple(self.IDENTITY)))
+        self.model = model
+        self.serial_number = serial_number
+        self.byte_time = byte_time
+        self.wire_time = 0.
+        self.commands = 0
+        # Faults: number of coming responses to lose, and to hold back
+        # past one read (in-process connections only)
+        self.drop_responses = 0
+        self.late_responses = 0
+        self.channel = 0
+        self.state = {}
+        self._lock = Lock()
+        self._pty = None
+        self._grammar = {}
+        for attribute, (dtype, write, read) in SynthHD.API.items():
+            for request, is_write in ((write, True), (read, False)):
+                if request is not None:
+                    self._grammar.setdefault(request[0], []).append(
+                        (_compile(request), attribute, is_write))
+
+    def connect(self, port=None, timeout=None, **kwargs):
+        """Open a serial port to the emulator. Usable as serial_factory.
+
+        Returns:
+            SynthHDEmulatorPort: port
+        """
+        return SynthHDEmulatorPort(self, port=port, timeout=timeout)
+
+    def open_pty(self):
+        """Serve the emulator on a pseudo-terminal.
+
+        Returns:
+            str: device path of the pseudo-terminal
+        """
+        import tty  # POSIX only
+        if self._pty is not None:
+            return self._pty[2]
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        path = os.ttyname(slave)
+        thread = Thread(target=self._serve_pty, args=(master,), daemon=True)
+        self._pty = (master, slave, path, thread)
+        thread.start()
+        return path
+
+    def close_pty(self):
+        """Stop serving the pseudo-terminal."""
+        if self._pty is not None:
+            master, slave, _, thread = self._pty
+            self._pty = None
+            # Hang up to wake the thread, and close the master once it has
+            # stopped, the descriptor may be reused by the next pty
+            os.close(slave)
+            thread.join()
+            os.close(master)
+
+    def process(self, data):
+        """Execute commands.
+
+        Args:
+            data (bytes): one or more complete commands
+
+        Returns:
+            list: response lines as bytes
+        """
+        responses, _ = self._consume(data.decode('utf-8'), final=True)
+        return responses
+
+    def get(self, attribute, *args, channel=None):
+        """Emulated device value of an attribute.
+
+        Args:
+            attribute (str): SynthHD.API attribute name
+            *args: index arguments, e.g. lookup table row
+            channel (int): channel, the selected channel by default
+
+        Returns:
+            value
+        """
+        return self._get(self._key(attribute, args, channel))
+
+    def _key(self, attribute, args, channel=None):
+        if attribute in SynthHD.DEVICE_ATTRIBUTES:
+            return (None, attribute) + tuple(args)
+        return (self.channel if channel is None else channel, attribute) + tuple(args)
+
+    def _get(self, key):
+        attribute = key[1]
+        if key in self.state:
+            return self.state[key]
+        if attribute in self.DEFAULTS:
+            return self.DEFAULTS[attribute]
+        dtype = SynthHD.API[attribute][0]
+        return (dtype[-1] if isinstance(dtype, tuple) else dtype)()
+
+    def _transfer(self, nbytes):
+        delay = nbytes * self.byte_time
+        if delay:
+            self.wire_time += delay
+            sleep(delay)
+
+    def _consume(self, data, final):
+        """Execute the complete commands at the start of data.
+
+        Args:
+            data (str): received data
+            final (bool): no more data follows, a trailing number is complete
+
+        Returns:
+            tuple: (list of response lines, unconsumed data)
+        """
+        responses = []
+        pos = 0
+        with self._lock:
+            while pos < len(data):
+                best = None
+                for regex, attribute, is_write in self._grammar.get(data[pos], ()):
+                    match = regex.match(data, pos)
+                    if match and (best is None or match.end() > best[0].end()):
+                        best = (match, attribute, is_write)
+                if best is None:
+                    # Unknown command or garbage: skip a character
+                    pos += 1
+                    continue
+                match, attribute, is_write = best
+                if match.end() == len(data) and not final and match.groups():
+                    break
+                response = self._execute(attribute, is_write, match.groups())
+                if response is not None:
+                    if self.drop_responses:
+                        self.drop_responses -= 1
+                    else:
+                        responses.append(response.encode('utf-8') + b'\n')
+                pos = match.end()
+                self.commands += 1
+        return responses, data[pos:]
+
+    def _execute(self, attribute, is_write, args):
+        dtype, write, _ = SynthHD.API[attribute]
+        dtype = dtype if isinstance(dtype, tuple) else (dtype,)
+        args = [int(float(ar)) if dt in (bool, int) else dt(ar) for dt, ar in zip(dtype, args)]
+        if is_write:
+            if not args:
+                return None
+            value = bool(args[-1]) if dtype[-1] is bool else args[-1]
+            if attribute == 'channel':
+                if value in (0, 1):
+                    self.channel = value
+                return None
+            self.state[self._key(attribute, args[:-1])] = value
+            return None
+        if attribute == 'channel':
+            return str(self.channel)
+        hw_version, sub_version = self.IDENTITY[self.model]
+        if attribute == 'model_type':
+            return 'WFT SynthHD {}'.format(self.serial_number)
+        if attribute == 'serial_number':
+            return str(self.serial_number)
+        if attribute == 'fw_version':
+            return 'Firmware Version 3.22'
+        if attribute == 'hw_version':
+            return hw_version
+        if attribute == 'sub_version':
+            return sub_version or ''
+        value = self._get(self._key(attribute, args))
+        if dtype[-1] is bool:
+            return str(int(value))
+        if dtype[-1] is float and write is not None:
+            return format(value, _format_specs(write)[-1])
+        return str(value)
+
+    def _serve_pty(self, master):
+        data = ''
+        while self._pty is not None:
+            try:
+                readable, _, _ = select([master], [], [], .005 if data else .1)
+                if readable:
+                    chunk = os.read(master, 4096)
+                    self._transfer(len(chunk))
+                    data += chunk.decode('utf-8')
+                elif not data:
+                    continue
+                responses, data = self._consume(data, final=not readable)
+                for response in responses:
+                    self._transfer(len(response))
+                    os.write(master, response)
+            except OSError:
+                return
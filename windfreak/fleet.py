@@ -0,0 +1,139 @@
+from .synth_hd import SynthHD
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+
+FleetResult = namedtuple('FleetResult', ('results', 'errors'))
+FleetResult.__doc__ = """Per-device outcome of a fleet operation.
+
+Attributes:
+    results (dict): return value by device path, for devices that succeeded
+    errors (dict): exception by device path, for devices that failed
+"""
+
+
+class SynthHDFleet(Mapping):
+    """Many SynthHD devices driven in parallel.
+
+    Devices are opened concurrently and operations are applied to all of
+    them from a thread pool, so the wall time of an operation approaches
+    that of the slowest device. Devices that fail to open are left out and
+    their exceptions kept in `open_errors`.
+
+    The fleet maps device path to SynthHD object.
+    """
+
+    def __init__(self, devpaths, max_workers=None, **kwargs):
+        """Open devices.
+
+        Args:
+            devpaths (iterable): serial device paths
+            max_workers (int): worker threads, one per device by default
+            **kwargs: SynthHD keyword arguments, e.g. cache
+        """
+        devpaths = list(dict.fromkeys(devpaths))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(len(devpaths), 1))
+        self._devices = {}
+        opened = self._run(devpaths, lambda devpath: SynthHD(devpath, **kwargs))
+        self._devices = opened.results
+        self.open_errors = opened.errors
+
+    def __del__(self):
+        # Construction may have failed before the thread pool was created
+        if getattr(self, '_executor', None) is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, key):
+        return self._devices.__getitem__(key)
+
+    def __iter__(self):
+        return self._devices.__iter__()
+
+    def __len__(self):
+        return self._devices.__len__()
+
+    def close(self):
+        """Close all devices."""
+        if self._executor is None:
+            return
+        self.map(SynthHD.close)
+        self._devices = {}
+        self._executor.shutdown()
+        self._executor = None
+
+    def map(self, func, *args, **kwargs):
+        """Apply a function to every device in parallel.
+
+        Args:
+            func (callable): called as func(device, *args, **kwargs)
+
+        Returns:
+            FleetResult: per-device results and errors
+        """
+        return self._run(self._devices,
+                         lambda devpath: func(self._devices[devpath], *args, **kwargs))
+
+    def init(self):
+        """Initialize all devices.
+
+        Returns:
+            FleetResult: per-device results and errors
+        """
+        return self.map(SynthHD.init)
+
+    def set_frequency(self, value, channel=0):
+        """Set channel frequency of all devices.
+
+        Args:
+            value (float / int / dict): frequency in Hz, or dict of frequency
+                by device path
+            channel (int): channel index
+
+        Returns:
+            FleetResult: per-device results and errors
+        """
+        return self._set(channel, 'frequency', value)
+
+    def set_power(self, value, channel=0):
+        """Set channel power of all devices.
+
+        Args:
+            value (float / int / dict): power in dBm, or dict of power by
+                device path
+            channel (int): channel index
+
+        Returns:
+            FleetResult: per-device results and errors
+        """
+        return self._set(channel, 'power', value)
+
+    def get_temperature(self):
+        """Temperature of all devices in Celsius.
+
+        Returns:
+            FleetResult: per-device temperatures and errors
+        """
+        return self.map(lambda device: device.temperature)
+
+    def _set(self, channel, name, value):
+        def set_value(devpath):
+            setattr(self._devices[devpath][channel], name,
+                    value[devpath] if isinstance(value, dict) else value)
+        return self._run(self._devices, set_value)
+
+    def _run(self, devpaths, func):
+        futures = {devpath: self._executor.submit(func, devpath) for devpath in devpaths}
+        results, errors = {}, {}
+        for devpath, future in futures.items():
+            try:
+                results[devpath] = future.result()
+            except Exception as exc:
+                errors[devpath] = exc
+        return FleetResult(results, errors)
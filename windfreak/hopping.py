@@ -0,0 +1,130 @@
+from statistics import mean, quantiles
+from threading import Event, Thread
+from time import monotonic
+
+
+class Hopper:
+    """Software-timed frequency hopping from a dedicated thread.
+
+    Every step of the schedule is encoded to bytes up-front, so the timed
+    loop only waits for the deadline on the monotonic clock and writes.
+    The achieved timing is reported by `stats`.
+
+        hopper = Hopper(synth, [(0., 0, 1.e9, None), (.01, 0, 1.1e9, None)])
+        hopper.start()
+        hopper.join()
+        print(hopper.stats)
+    """
+
+    # Wait the last seconds before a deadline by spinning instead of sleeping
+    SPIN_TIME = 1.e-3
+
+    def __init__(self, synth, schedule, tolerance=1.e-3):
+        """Create hopper and encode the schedule.
+
+        Args:
+            synth (SynthHD): device
+            schedule (iterable): steps of (time in s from start, channel
+                index, frequency in Hz, power in dBm or None to keep)
+            tolerance (float): lateness in s above which a step counts as
+                a missed deadline, see `stats`
+        """
+        steps = sorted(schedule, key=lambda step: step[0])
+        self._synth = synth
+        self._tolerance = tolerance
+        self._steps = []
+        for time, index, frequency, power in steps:
+            channel = synth[index]
+            f_range = channel.frequency_range
+            if f_range is not None and not f_range['start'] <= frequency <= f_range['stop']:
+                raise ValueError('Expected float in range [{}, {}] Hz.'.format(
+                                 f_range['start'], f_range['stop']))
+            p_range = channel.power_range
+            if (power is not None and p_range is not None
+                    and not p_range['start'] <= power <= p_range['stop']):
+                raise ValueError('Expected float in range [{}, {}] dBm.'.format(
+                                 p_range['start'], p_range['stop']))
+            # Every step selects its channel, other users of a shared
+            # device may select another one in between
+            data = synth.encode('channel', index) + synth.encode('frequency', frequency / 1e6)
+            if power is not None:
+                data += synth.encode('power', power)
+            self._steps.append((float(time), data))
+        self._lateness = []
+        self._stop = Event()
+        self._thread = None
+        self._error = None
+
+    def start(self):
+        """Start hopping. Returns immediately."""
+        if self._thread is not None:
+            raise RuntimeError('Hopper has already been started.')
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop hopping after the current step."""
+        self._stop.set()
+        self.join()
+
+    def join(self, timeout=None):
+        """Wait for the schedule to complete.
+
+        Args:
+            timeout (float): seconds to wait, forever by default
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._error is not None:
+            raise self._error
+
+    @property
+    def running(self):
+        """Hopper thread is running.
+
+        Returns:
+            bool: running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def stats(self):
+        """Achieved timing of the steps run so far.
+
+        The lateness of a step is the time from its deadline until its write
+        has returned, e.g. after waiting for another user of the device.
+
+        Returns:
+            dict: steps, missed deadlines, and mean, p50, p99 and max
+                lateness (jitter) in seconds
+        """
+        lateness = list(self._lateness)
+        stats = {'steps': len(lateness),
+                 'missed': sum(late > self._tolerance for late in lateness)}
+        if lateness:
+            percentiles = quantiles(lateness, n=100) if len(lateness) > 1 else lateness * 99
+            stats.update(mean=mean(lateness), p50=percentiles[49],
+                         p99=percentiles[98], max=max(lateness))
+        return stats
+
+    def _run(self):
+        write = self._synth.write_raw
+        lateness = self._lateness
+        spin_time = self.SPIN_TIME
+        start = monotonic()
+        try:
+            for time, data in self._steps:
+                deadline = start + time
+                remaining = deadline - monotonic()
+                if remaining > spin_time:
+                    if self._stop.wait(remaining - spin_time):
+                        return
+                while monotonic() < deadline:
+                    pass
+                write(data)
+                # Until written, including waiting for the device lock
+                lateness.append(monotonic() - deadline)
+                if self._stop.is_set():
+                    return
+        except Exception as exc:
+            self._error = exc
@@ -0,0 +1,199 @@
+import json
+import os
+from collections import deque, namedtuple
+from threading import Lock, get_ident
+
+
+IOEvent = namedtuple('IOEvent', ('kind', 'attribute', 'start', 'duration', 'bytes_out',
+                                 'bytes_in', 'error', 'thread'))
+IOEvent.__doc__ = """A request to a device and its outcome.
+
+Attributes:
+    kind (str): 'read', 'write' or 'cached' for a read served by the cache
+    attribute (str): attribute name, '<raw>' for write_raw data
+    start (float): monotonic time in seconds
+    duration (float): seconds, round-trip time for reads
+    bytes_out (int): bytes written
+    bytes_in (int): bytes read
+    error (Exception): exception raised or None
+    thread (int): identifier of the calling thread
+"""
+
+
+class _Counters:
+
+    __slots__ = ('reads', 'writes', 'cached', 'bytes_out', 'bytes_in', 'timeouts',
+                 'errors', 'time', 'max', 'histogram')
+
+    def __init__(self):
+        self.reads = self.writes = self.cached = 0
+        self.bytes_out = self.bytes_in = 0
+        self.timeouts = self.errors = 0
+        self.time = self.max = 0.
+        self.histogram = {}
+
+    def add(self, event):
+        if event.kind == 'read':
+            self.reads += 1
+            # Latency bucket: upper bound in microseconds, a power of two
+            bucket = 1 << max(int(event.duration * 1e6), 1).bit_length()
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+            if event.duration > self.max:
+                self.max = event.duration
+        elif event.kind == 'write':
+            self.writes += 1
+        else:
+            self.cached += 1
+        self.bytes_out += event.bytes_out
+        self.bytes_in += event.bytes_in
+        self.time += event.duration
+        if event.error is not None:
+            if isinstance(event.error, TimeoutError):
+                self.timeouts += 1
+            else:
+                self.errors += 1
+
+    def merge(self, other):
+        for name in ('reads', 'writes', 'cached', 'bytes_out', 'bytes_in', 'timeouts',
+                     'errors', 'time'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.max = max(self.max, other.max)
+        for bucket, count in other.histogram.items():
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + count
+
+    def percentile(self, fraction):
+        """Latency percentile in seconds, the upper bound of its bucket."""
+        remaining = fraction * self.reads
+        for bucket in sorted(self.histogram):
+            remaining -= self.histogram[bucket]
+            if remaining <= 0:
+                return min(bucket / 1e6, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'reads': self.reads,
+            'writes': self.writes,
+            'cached': self.cached,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'time': self.time,
+            'latency': {
+                'p50': self.percentile(.5),
+                'p99': self.percentile(.99),
+                'max': self.max,
+                'histogram': dict(sorted(self.histogram.items())),
+            },
+        }
+
+
+class Instrumentation:
+    """I/O statistics of a device, see SerialDevice.instrument.
+
+    Every request is counted by attribute: requests, bytes in and out,
+    timeouts and errors, and the round-trip latency of reads in a
+    histogram of power of two microsecond buckets. Hooks are called with
+    an IOEvent per request, and the most recent events may be kept for
+    export as a Chrome trace (chrome://tracing, Perfetto). Requests may be
+    recorded from any thread while the statistics are read.
+    """
+
+    def __init__(self, trace=False, trace_size=100000):
+        """Create instrumentation.
+
+        Args:
+            trace (bool): keep events for `export_trace`
+            trace_size (int): number of most recent events kept
+        """
+        self.hooks = []
+        self._lock = Lock()
+        self._counters = {}
+        self._trace = deque(maxlen=trace_size) if trace else None
+
+    def record(self, kind, attribute, start, duration, bytes_out=0, bytes_in=0, error=None):
+        """Record a request. Called by the device.
+
+        Args:
+            kind (str): see IOEvent
+            attribute (str): attribute name
+            start (float): monotonic time in seconds
+            duration (float): seconds
+            bytes_out (int): bytes written
+            bytes_in (int): bytes read
+            error (Exception): exception raised or None
+        """
+        event = IOEvent(kind, attribute, start, duration, bytes_out, bytes_in, error, get_ident())
+        with self._lock:
+            counters = self._counters.get(attribute)
+            if counters is None:
+                counters = self._counters[attribute] = _Counters()
+            counters.add(event)
+            if self._trace is not None:
+                self._trace.append(event)
+        for hook in self.hooks:
+            hook(event)
+
+    def reset(self):
+        """Discard the statistics and events recorded so far."""
+        with self._lock:
+            self._counters.clear()
+            if self._trace is not None:
+                self._trace.clear()
+
+    def stats(self):
+        """Statistics by attribute, and their total.
+
+        Returns:
+            dict: dict of reads, writes, cached reads, bytes_out, bytes_in,
+                timeouts, errors, time in s and read latency (p50, p99 and
+                max in s, histogram of counts by bucket upper bound in us)
+                by attribute name and 'total'
+        """
+        total = _Counters()
+        stats = {}
+        with self._lock:
+            for attribute, counters in sorted(self._counters.items()):
+                total.merge(counters)
+                stats[attribute] = counters.as_dict()
+        stats['total'] = total.as_dict()
+        return stats
+
+    def export_stats(self, path):
+        """Write the statistics to a JSON file.
+
+        Args:
+            path (str): file path
+        """
+        with open(path, 'w') as file:
+            json.dump(self.stats(), file, indent=2)
+
+    def export_trace(self, path):
+        """Write the events kept to a Chrome trace JSON file.
+
+        Args:
+            path (str): file path
+        """
+        if self._trace is None:
+            raise RuntimeError('Tracing is not enabled.')
+        pid = os.getpid()
+        with self._lock:
+            trace = list(self._trace)
+        events = []
+        for event in trace:
+            args = {'bytes_out': event.bytes_out, 'bytes_in': event.bytes_in}
+            if event.error is not None:
+                args['error'] = repr(event.error)
+            events.append({
+                'name': event.attribute,
+                'cat': event.kind,
+                'ph': 'X',
+                'ts': event.start * 1e6,
+                'dur': event.duration * 1e6,
+                'pid': pid,
+                'tid': event.thread,
+                'args': args,
+            })
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
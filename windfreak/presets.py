@@ -0,0 +1,135 @@
+from .state import SynthHDState
+from collections.abc import MutableMapping
+import json
+import os
+
+
+class PresetStore(MutableMapping):
+    """Named SynthHD configurations stored in a JSON file.
+
+    The store maps preset name to SynthHDState. Loading a preset onto a
+    device writes only the attributes that differ, see SynthHD.apply:
+
+        presets = PresetStore('presets.json')
+        presets.save('calibration', synth)
+        ...
+        presets.apply('calibration', synth)
+
+    Every change rewrites the file atomically. The file is read again when
+    it has been changed, e.g. by another process.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        """Open store. The file is created on the first save.
+
+        Args:
+            path (str): file path
+        """
+        self._path = path
+        self._presets = {}
+        self._mtime = None
+
+    def __getitem__(self, name):
+        return self._load()[name][0]
+
+    def __setitem__(self, name, state):
+        if not isinstance(state, SynthHDState):
+            raise TypeError('Expected SynthHDState.')
+        self._store(name, (state, None))
+
+    def __delitem__(self, name):
+        presets = self._load()
+        del presets[name]
+        self._dump(presets)
+
+    def __iter__(self):
+        return iter(list(self._load()))
+
+    def __len__(self):
+        return len(self._load())
+
+    def save(self, name, synth, tables=False):
+        """Save the configuration of a device.
+
+        Args:
+            name (str): preset name
+            synth (SynthHD): device
+            tables (bool): include the AM and sweep lookup tables
+        """
+        self._store(name, (synth.snapshot(tables=tables), synth.model))
+
+    def model(self, name):
+        """Model of the device a preset was saved from.
+
+        Args:
+            name (str): preset name
+
+        Returns:
+            str: model version or None if unknown
+        """
+        return self._load()[name][1]
+
+    def apply(self, name, synth, base=None):
+        """Load a preset onto a device, writing only the differences.
+
+        Args:
+            name (str): preset name
+            synth (SynthHD): device
+            base (SynthHDState): configuration of the device, see SynthHD.apply
+
+        Returns:
+            int: number of attributes written
+        """
+        state, model = self._load()[name]
+        if model is not None and model != synth.model:
+            raise ValueError('Preset \'{}\' is for model {}, device is {}.'.format(
+                             name, model, synth.model))
+        return synth.apply(state, base=base)
+
+    def _store(self, name, preset):
+        if not isinstance(name, str):
+            raise TypeError('Expected str.')
+        presets = self._load()
+        presets[name] = preset
+        self._dump(presets)
+
+    def _load(self):
+        """Presets by name, read again if the file has changed.
+
+        Returns:
+            dict: (SynthHDState, model) by name
+        """
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+        except FileNotFoundError:
+            self._presets, self._mtime = {}, None
+            return self._presets
+        if mtime != self._mtime:
+            with open(self._path) as file:
+                data = json.load(file)
+            if data.get('version') != self.VERSION:
+                raise ValueError('Unsupported preset file version {}.'.format(data.get('version')))
+            self._presets = {
+                name: (SynthHDState((tuple(entry[:-1]), entry[-1]) for entry in preset['state']),
+                       preset.get('model'))
+                for name, preset in data['presets'].items()
+            }
+            self._mtime = mtime
+        return self._presets
+
+    def _dump(self, presets):
+        data = {
+            'version': self.VERSION,
+            'presets': {
+                name: {'model': model, 'state': [[*key, value] for key, value in state.items()]}
+                for name, (state, model) in presets.items()
+            },
+        }
+        temp_path = '{}.{}.tmp'.format(self._path, os.getpid())
+        with open(temp_path, 'w') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(temp_path, self._path)
+        self._presets = presets
+        self._mtime = os.stat(self._path).st_mtime_ns
@@ -0,0 +1,90 @@
+class PulseProgram:
+    """Pulse modulation program of a SynthHD channel.
+
+    Pulse times and repetitions are validated together on construction.
+    The parameters are sent with the first `apply`, `fire` or `start`, and
+    after that `fire` sends the trigger alone, so that a train costs one
+    command. Methods return coroutines on an AsyncSynthHDChannel:
+
+        program = PulseProgram(synth[0], on_time=10, off_time=90, repetitions=100)
+        for _ in range(1000):
+            program.fire()
+    """
+
+    ON_TIME_RANGE = {'start': 1, 'stop': 10000000, 'step': 1}
+    OFF_TIME_RANGE = {'start': 2, 'stop': 10000000, 'step': 1}
+    REPETITIONS_RANGE = {'start': 1, 'stop': 65500, 'step': 1}
+
+    def __init__(self, channel, on_time, off_time, repetitions=1, invert=False, dual=False):
+        """Create and validate pulse program.
+
+        Args:
+            channel (SynthHDChannel / AsyncSynthHDChannel): channel to
+                modulate
+            on_time (int): pulse on time in us
+            off_time (int): pulse off time in us
+            repetitions (int): pulses per train
+            invert (bool): invert pulse polarity
+            dual (bool): dual pulse modulation
+        """
+        for name, value, v_range in (('on_time', on_time, self.ON_TIME_RANGE),
+                                     ('off_time', off_time, self.OFF_TIME_RANGE),
+                                     ('repetitions', repetitions, self.REPETITIONS_RANGE)):
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise TypeError('Expected int for {}.'.format(name))
+            if not v_range['start'] <= value <= v_range['stop']:
+                raise ValueError('Expected {} in range [{}, {}].'.format(
+                                 name, v_range['start'], v_range['stop']))
+        for name, value in (('invert', invert), ('dual', dual)):
+            if not isinstance(value, bool):
+                raise TypeError('Expected bool for {}.'.format(name))
+        self._channel = channel
+        self._parameters = (
+            ('pulse_on_time', on_time),
+            ('pulse_off_time', off_time),
+            ('pulse_num_rep', repetitions),
+            ('pulse_invert', invert),
+            ('dual_pulse_mod', dual),
+        )
+        self._duration = repetitions * (on_time + off_time) / 1e6
+        self._applied = False
+
+    @property
+    def duration(self):
+        """Duration of one pulse train in seconds.
+
+        Returns:
+            float: duration
+        """
+        return self._duration
+
+    def apply(self):
+        """Push the parameters that differ from the known device state.
+
+        Call again if the pulse parameters of the channel were changed by
+        other means, `fire` and `start` only push them once.
+
+        Returns:
+            int: number of parameters written
+        """
+        written = self._channel.write_changed_many(self._parameters)
+        self._applied = True
+        return written
+
+    def _send(self, writes):
+        parameters = () if self._applied else self._parameters
+        written = self._channel.write_changed_many(parameters, writes)
+        self._applied = True
+        return written
+
+    def fire(self):
+        """Run a single pulse train, applied first if needed. Returns immediately."""
+        return self._send((('pulse_single',),))
+
+    def start(self):
+        """Pulse continuously, applied first if needed. Returns immediately."""
+        return self._send((('pulse_cont', True),))
+
+    def stop(self):
+        """Stop pulsing continuously."""
+        return self._channel.write('pulse_cont', False)
@@ -0,0 +1,196 @@
+import json
+from threading import Lock
+from time import monotonic, sleep
+from serial import Serial
+
+
+class Recorder:
+    """Record the serial traffic of a device to a JSON lines file.
+
+    Use as the serial_factory of a device. Every write and every response
+    line is logged with its monotonic time since the port was opened:
+
+        synth = SynthHD('/dev/ttyACM0', serial_factory=Recorder('session.jsonl'))
+
+    The file starts a session per port opened, with a header line
+    {"port": ..., "version": 1}, followed by events {"t": ..., "w": ...} for
+    writes and {"t": ..., "r": ...} for responses. Data is the bytes as
+    latin-1 text, a response without newline terminator is a timeout.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, serial_factory=Serial):
+        """Create recorder.
+
+        Args:
+            path (str): file path, appended to
+            serial_factory (callable): opens the recorded port
+        """
+        self._path = path
+        self._serial_factory = serial_factory
+
+    def __call__(self, port=None, **kwargs):
+        """Open a recording port. Usable as serial_factory.
+
+        Returns:
+            RecordingPort: port
+        """
+        return RecordingPort(self._serial_factory(port=port, **kwargs), self._path, self.VERSION)
+
+
+class RecordingPort:
+    """Serial port that logs its traffic, see Recorder."""
+
+    def __init__(self, dev, path, version):
+        self._dev = dev
+        self._file = open(path, 'a')
+        self._start = monotonic()
+        self._log({'port': getattr(dev, 'port', None), 'version': version})
+
+    def __getattr__(self, name):
+        # Everything not recorded, e.g. timeout or is_open
+        return getattr(self._dev, name)
+
+    def __setattr__(self, name, value):
+        if name in ('_dev', '_file', '_start'):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._dev, name, value)
+
+    def write(self, data):
+        self._log({'t': monotonic() - self._start, 'w': bytes(data).decode('latin-1')})
+        return self._dev.write(data)
+
+    def readline(self):
+        line = self._dev.readline()
+        self._log({'t': monotonic() - self._start, 'r': line.decode('latin-1')})
+        return line
+
+    def close(self):
+        try:
+            self._dev.close()
+        finally:
+            self._file.close()
+
+    def _log(self, event):
+        self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+
+
+class Replayer:
+    """Serve recorded responses in place of a device.
+
+    Use as the serial_factory of a device to run it against a recording of
+    Recorder. Responses are returned in recorded order, each delayed after
+    the write preceding it as recorded, divided by speed:
+
+        synth = SynthHD('replay', serial_factory=Replayer('session.jsonl', speed=10.))
+
+    The data written is not interpreted, so that drivers which batch
+    requests differently may be replayed; with strict it must equal the
+    recorded data.
+    """
+
+    def __init__(self, path, speed=1., strict=False):
+        """Load recording.
+
+        Args:
+            path (str): file path
+            speed (float): time scale of the responses, None for no delay
+            strict (bool): raise ValueError on writes that differ from the
+                recording
+        """
+        self.speed = speed
+        self.strict = strict
+        self._written = []
+        self._responses = []
+        last_write = 0.
+        with open(path) as file:
+            for line in file:
+                event = json.loads(line)
+                if 'w' in event:
+                    last_write = event['t']
+                    self._written.append(event['w'].encode('latin-1'))
+                elif 'r' in event:
+                    self._responses.append((event['t'] - last_write, event['r'].encode('latin-1')))
+                else:
+                    # New session, times restart
+                    last_write = 0.
+        self._written = b''.join(self._written)
+        self._position = 0
+        self._next = 0
+        self._lock = Lock()
+
+    @property
+    def remaining(self):
+        """Number of recorded responses not yet served.
+
+        Returns:
+            int: responses
+        """
+        return len(self._responses) - self._next
+
+    def __call__(self, port=None, timeout=None, **kwargs):
+        """Open a port serving the recording. Usable as serial_factory.
+
+        Returns:
+            ReplayPort: port
+        """
+        return ReplayPort(self, port=port, timeout=timeout)
+
+    def _write(self, data):
+        data = bytes(data)
+        with self._lock:
+            if self.strict:
+                expected = self._written[self._position:self._position + len(data)]
+                if data != expected:
+                    raise ValueError('Write {!r} differs from recording {!r} at byte {}.'.format(
+                                     data, expected, self._position))
+            self._position += len(data)
+
+    def _response(self):
+        with self._lock:
+            if self._next >= len(self._responses):
+                return None, b''
+            response = self._responses[self._next]
+            self._next += 1
+            return response
+
+
+class ReplayPort:
+    """Serial port connected to a Replayer."""
+
+    def __init__(self, replayer, port=None, timeout=None):
+        self._replayer = replayer
+        self._last_write = monotonic()
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError('Port is closed.')
+        self._replayer._write(data)
+        self._last_write = monotonic()
+        return len(data)
+
+    def readline(self):
+        if not self.is_open:
+            raise OSError('Port is closed.')
+        delay, line = self._replayer._response()
+        speed = self._replayer.speed
+        if delay is not None and speed is not None:
+            remaining = self._last_write + delay / speed - monotonic()
+            if remaining > 0.:
+                sleep(remaining)
+        return line
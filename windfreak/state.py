@@ -0,0 +1,67 @@
+from collections.abc import Mapping
+
+
+class SynthHDState(Mapping):
+    """Immutable configuration of a SynthHD, see SynthHD.snapshot.
+
+    Maps state keys of (channel index, or None for device attributes,
+    attribute name, *index arguments) to values in the units of SynthHD.API,
+    e.g. frequency in MHz:
+
+        state[(0, 'frequency')]
+        state[(None, 'reference_mode')]
+        state[(1, 'am_lookup_table', 7)]
+
+    Keys are kept in the order the configuration is applied.
+    """
+
+    __slots__ = ('_values',)
+
+    def __init__(self, values=()):
+        """Create state.
+
+        Args:
+            values (mapping / iterable): values by state key
+        """
+        self._values = dict(values)
+
+    def __getitem__(self, key):
+        return self._values.__getitem__(key)
+
+    def __iter__(self):
+        return self._values.__iter__()
+
+    def __len__(self):
+        return self._values.__len__()
+
+    def __hash__(self):
+        return hash(frozenset(self._values.items()))
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._values)
+
+    def replace(self, values):
+        """Copy with some values replaced or added.
+
+        Args:
+            values (mapping): values by state key
+
+        Returns:
+            SynthHDState: state
+        """
+        state = dict(self._values)
+        state.update(values)
+        return type(self)(state)
+
+    def diff(self, other):
+        """Values that differ from another state.
+
+        Args:
+            other (SynthHDState): state to compare to
+
+        Returns:
+            dict: (value in self or None, value in other or None) by state key
+        """
+        return {key: (self.get(key), other.get(key))
+                for key in dict.fromkeys([*self, *other])
+                if self.get(key) != other.get(key)}
@@ -0,0 +1,120 @@
+from math import floor
+
+
+class Sweep:
+    """Hardware-timed linear sweep of a SynthHD channel.
+
+    The configuration is checked as a whole on construction, so that an
+    invalid sweep fails before anything is sent. Only parameters changed on
+    the device are rewritten. `run_single`, `start` and `stop` return
+    immediately while the device sweeps, or coroutines on an
+    AsyncSynthHDChannel:
+
+        sweep = Sweep(synth[0], 1.e9, 2.e9, 1.e6, time_step=4.)
+        sweep.start()
+    """
+
+    DIRECTIONS = ('down', 'up')
+    TIME_STEP_RANGE = {'start': 4., 'stop': 10000., 'step': 0.001}
+    POWER_RANGE = {'start': -60., 'stop': 20., 'step': 0.001}
+
+    def __init__(self, channel, start, stop, step, time_step, power_start=None,
+                 power_stop=None, direction='up'):
+        """Create and validate sweep.
+
+        Args:
+            channel (SynthHDChannel / AsyncSynthHDChannel): channel to sweep
+            start (float / int): lower frequency in Hz
+            stop (float / int): upper frequency in Hz
+            step (float / int): frequency step in Hz
+            time_step (float / int): dwell time per point in ms
+            power_start (float / int): power at the lower frequency in dBm,
+                the channel power by default, required for an
+                AsyncSynthHDChannel
+            power_stop (float / int): power at the upper frequency in dBm,
+                power_start by default
+            direction (str): 'up' or 'down'
+        """
+        for name, value in (('start', start), ('stop', stop), ('step', step),
+                            ('time_step', time_step)):
+            if not isinstance(value, (float, int)):
+                raise TypeError('Expected float or int for {}.'.format(name))
+        f_range = channel.frequency_range
+        if f_range is not None:
+            for value in (start, stop):
+                if not f_range['start'] <= value <= f_range['stop']:
+                    raise ValueError('Expected float in range [{}, {}] Hz.'.format(
+                                     f_range['start'], f_range['stop']))
+        if not start <= stop:
+            raise ValueError('Expected start <= stop.')
+        if not step > 0.:
+            raise ValueError('Expected step > 0.')
+        t_range = self.TIME_STEP_RANGE
+        if not t_range['start'] <= time_step <= t_range['stop']:
+            raise ValueError('Expected time step in range [{}, {}] ms.'.format(
+                             t_range['start'], t_range['stop']))
+        if power_start is None:
+            power_start = channel.power
+        if power_stop is None:
+            power_stop = power_start
+        p_range = self.POWER_RANGE
+        for value in (power_start, power_stop):
+            if not isinstance(value, (float, int)):
+                raise TypeError('Expected float or int for power.')
+            if not p_range['start'] <= value <= p_range['stop']:
+                raise ValueError('Expected power in range [{}, {}] dBm.'.format(
+                                 p_range['start'], p_range['stop']))
+        if direction not in self.DIRECTIONS:
+            raise ValueError('Expected str in set {}.'.format(self.DIRECTIONS))
+        self._channel = channel
+        self._parameters = (
+            ('sweep_type', 0),
+            ('sweep_freq_low', start / 1e6),
+            ('sweep_freq_high', stop / 1e6),
+            ('sweep_freq_step', step / 1e6),
+            ('sweep_time_step', time_step),
+            ('sweep_power_low', power_start),
+            ('sweep_power_high', power_stop),
+            ('sweep_direction', self.DIRECTIONS.index(direction)),
+        )
+        self._points = floor((stop - start) / step + 1e-9) + 1
+        self._time_step = time_step
+
+    @property
+    def points(self):
+        """Number of points in the sweep.
+
+        Returns:
+            int: points
+        """
+        return self._points
+
+    @property
+    def duration(self):
+        """Duration of one sweep in seconds.
+
+        Returns:
+            float: duration
+        """
+        return self._points * self._time_step / 1e3
+
+    def apply(self):
+        """Push the parameters that differ from the known device state.
+
+        Returns:
+            int: number of parameters written
+        """
+        return self._channel.write_changed_many(self._parameters)
+
+    def run_single(self):
+        """Apply and run a single sweep. Returns immediately."""
+        return self._channel.write_changed_many(self._parameters, (('sweep_single', True),))
+
+    def start(self):
+        """Apply and sweep continuously. Returns immediately."""
+        return self._channel.write_changed_many(self._parameters, (('sweep_cont', True),))
+
+    def stop(self):
+        """Stop sweeping."""
+        return self._channel.write_changed_many((), (('sweep_cont', False),
+                                                     ('sweep_single', False)))
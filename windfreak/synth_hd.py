@@ -1,5 +1,128 @@
-from .device import SerialDevice
+from .device import SerialDevice, AsyncSerialDevice
+from .state import SynthHDState
+from array import array
+import asyncio
 from collections.abc import Sequence
+from contextlib import nullcontext
+from math import isnan
+import json
+import os
+from time import monotonic
+
+
+# Channel ranges by model: frequency, power, VGA DAC and channel spacing
+_CHANNEL_RANGES = {
+    'SynthHD v1.4': (
+        {'start': 53.e6, 'stop': 13999.999999e6, 'step': 0.1},
+        {'start': -80., 'stop': 20., 'step': 0.01},
+        {'start': 0, 'stop': 45000, 'step': 1},
+        None,
+    ),
+    'SynthHD v2': (
+        {'start': 10.e6, 'stop': 15000.e6, 'step': 0.1},
+        {'start': -70., 'stop': 20., 'step': 0.01},
+        {'start': 0, 'stop': 4000, 'step': 1},
+        {'start': 0.1, 'stop': 1000., 'step': 0.1},
+    ),
+    'SynthHD PRO v2': (
+        {'start': 10.e6, 'stop': 24000.e6, 'step': 0.1},
+        {'start': -70., 'stop': 20., 'step': 0.01},
+        {'start': 0, 'stop': 4000, 'step': 1},
+        {'start': 0.1, 'stop': 1000., 'step': 0.1},
+    ),
+}
+
+_TEMP_COMPENSATION_MODES = ('none', 'on set', '1 sec', '10 sec')
+
+_REFERENCE_MODES = ('external', 'internal 27mhz', 'internal 10mhz')
+
+_TRIGGER_MODES = (
+    'disabled',
+    'full frequency sweep',
+    'single frequency step',
+    'stop all',
+    'rf enable',
+    'remove interrupts',
+    'reserved',
+    'reserved',
+    'am modulation',
+    'fm modulation',
+)
+
+
+# Configuration captured by SynthHD.snapshot, in the order it is applied.
+# Switches are turned off, in reverse order, before and turned on after the
+# other attributes.
+_STATE_DEVICE_ATTRIBUTES = ('reference_mode', 'ref_frequency', 'trig_function')
+
+_STATE_CHANNEL_ATTRIBUTES = (
+    'frequency', 'power', 'phase_step', 'temp_comp_mode', 'channelspacing',
+    'sweep_freq_low', 'sweep_freq_high', 'sweep_freq_step', 'sweep_time_step',
+    'sweep_power_low', 'sweep_power_high', 'sweep_direction', 'sweep_diff_freq',
+    'sweep_diff_meth', 'sweep_type',
+    'am_time_step', 'am_num_samples',
+    'pulse_on_time', 'pulse_off_time', 'pulse_num_rep', 'pulse_invert',
+    'fm_frequency', 'fm_deviation', 'fm_num_samples', 'fm_mod_type',
+    'pll_power_on', 'pa_power_on', 'rf_enable',
+    'sweep_cont', 'am_cont', 'pulse_cont', 'dual_pulse_mod', 'fm_cont',
+)
+
+_STATE_SWITCHES = frozenset((
+    'pll_power_on', 'pa_power_on', 'rf_enable',
+    'sweep_cont', 'am_cont', 'pulse_cont', 'dual_pulse_mod', 'fm_cont',
+))
+
+
+def _load_identities(path):
+    """Models by device path from an identity cache file.
+
+    Args:
+        path (str): cache file path
+
+    Returns:
+        dict: model by device path, empty if the file is missing or invalid
+    """
+    try:
+        with open(path) as file:
+            identities = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return identities if isinstance(identities, dict) else {}
+
+
+def _store_identity(path, devpath, model):
+    """Record the model of a device path in an identity cache file."""
+    identities = _load_identities(path)
+    identities[devpath] = model
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'w') as file:
+        json.dump(identities, file, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def _model(hw_version, sub_version=None):
+    """Binned model version from hardware version and sub-version.
+
+    Args:
+        hw_version (str): hardware version
+        sub_version (str): sub-version, only read for hardware version 2
+
+    Returns:
+        str: model version or None if unsupported
+    """
+    if 'Version 2.' in hw_version:
+        if sub_version == 'HD':
+            return 'SynthHD v2'
+        elif sub_version == 'HDPRO':
+            return 'SynthHD PRO v2'
+        else:
+            # Unsupported sub-version. Return None.
+            return None
+    elif 'Version 1.4' in hw_version:
+        return 'SynthHD v1.4'
+    else:
+        # Unsupported hardware version. Return None.
+        return None
 
 
 class SynthHDChannel:
@@ -9,9 +132,7 @@ class SynthHDChannel:
         self._index = index
         model = self._parent.model
         if model == 'SynthHD v1.4':
-            self._f_range = {'start': 53.e6, 'stop': 13999.999999e6, 'step': 0.1}
-            self._p_range = {'start': -80., 'stop': 20., 'step': 0.01}
-            self._vga_range = {'start': 0, 'stop': 45000, 'step': 1}
+            self._f_range, self._p_range, self._vga_range, _ = _CHANNEL_RANGES[model]
         else:
             self._f_range = None
             self._p_range = None
@@ -19,27 +140,74 @@ class SynthHDChannel:
 
     def init(self):
         """Initialize device."""
-        self.enable = False
-        f_range = self.frequency_range
-        if f_range is not None:
-            self.frequency = f_range['start']
-        p_range = self.power_range
-        if p_range is not None:
-            self.power = p_range['start']
-        self.phase = 0.
-        self.temp_compensation_mode = '10 sec'
-
+        with self._parent.batch():
+            self.enable = False
+            f_range = self.frequency_range
+            if f_range is not None:
+                self.frequency = f_range['start']
+            p_range = self.power_range
+            if p_range is not None:
+                self.power = p_range['start']
+            self.phase = 0.
+            self.temp_compensation_mode = '10 sec'
+
+    # Select and request under one acquisition of the device lock
     def write(self, attribute, *args):
-        self.select()
-        self._parent.write(attribute, *args)
+        parent = self._parent
+        parent._scoped(self._index, parent._write_attribute, attribute, args, parent.dirty_only)
 
     def read(self, attribute, *args):
-        self.select()
-        return self._parent.read(attribute, *args)
+        parent = self._parent
+        return parent._scoped(self._index, parent._read_attribute, attribute, args)
+
+    def write_changed(self, attribute, *args):
+        parent = self._parent
+        return parent._scoped(self._index, parent._write_attribute, attribute, args, True)
+
+    def read_many(self, *requests):
+        parent = self._parent
+        return parent._scoped(self._index, parent._read_many, requests)
+
+    def batch(self):
+        """Collect writes and send them to the device in a single transfer.
+
+        See SerialDevice.batch.
+        """
+        return self._parent.batch()
+
+    def write_changed_many(self, parameters, writes=()):
+        """Write parameters that differ from the known state, then commands,
+        in a single transfer.
+
+        Args:
+            parameters (iterable): (attribute, *args) tuples, suppressed if
+                equal to the known state
+            writes (iterable): (attribute, *args) tuples, always written
+
+        Returns:
+            int: number of parameters written
+        """
+        with self._parent.batch():
+            written = sum(self.write_changed(*parameter) for parameter in parameters)
+            for write in writes:
+                self.write(*write)
+        return written
+
+    def transaction(self):
+        """Hold the device for a sequence of operations on this channel.
+
+        See SerialDevice.transaction.
+        """
+        return self._parent.transaction()
 
     def select(self):
-        """Select channel."""
-        self._parent.write('channel', self._index)
+        """Select channel.
+
+        The select command is deferred until the next channel command and is
+        skipped if the channel is already selected on the device.
+        """
+        # Under the device lock, not to redirect another thread's command
+        self._parent._scoped(self._index, lambda: None)
 
     @property
     def frequency_range(self):
@@ -119,7 +287,7 @@ class SynthHDChannel:
         Returns:
             tuple: tuple of str of modes
         """
-        return ('none', 'on set', '1 sec', '10 sec')
+        return _TEMP_COMPENSATION_MODES
 
     @property
     def temp_compensation_mode(self):
@@ -275,6 +443,124 @@ class SynthHDChannel:
         """
         return self.read('pll_lock')
 
+    @property
+    def sweep_table_size(self):
+        """Number of rows in the tabular sweep table.
+
+        Returns:
+            int: rows
+        """
+        return 100
+
+    @property
+    def sweep_table(self):
+        """Get tabular sweep table, up to the first row with zero frequency.
+
+        Returns:
+            dict: 'frequency' in Hz and 'power' in dBm, as array('d') columns
+        """
+        rows = range(self.sweep_table_size)
+        values = self.read_many(*(('sweep_table_freq', row) for row in rows),
+                                *(('sweep_table_power', row) for row in rows))
+        frequency, power = values[:len(rows)], values[len(rows):]
+        length = frequency.index(0.) if 0. in frequency else len(rows)
+        return {
+            'frequency': array('d', (value * 1e6 for value in frequency[:length])),
+            'power': array('d', power[:length]),
+        }
+
+    @sweep_table.setter
+    def sweep_table(self, value):
+        """Set tabular sweep table.
+
+        The columns are validated as a whole and uploaded in a single transfer.
+        Rows equal to the known device state, e.g. from the last upload, are
+        not sent. The table is terminated by a row with zero frequency.
+
+        Args:
+            value (dict): 'frequency' in Hz and 'power' in dBm columns, e.g.
+                lists or numpy arrays of equal length, and optionally a
+                scalar 'time_step' in ms applying to all rows
+        """
+        if not isinstance(value, dict) or not {'frequency', 'power'} <= set(value):
+            raise TypeError('Expected dict with frequency and power columns.')
+        try:
+            frequency = array('d', value['frequency'])
+            power = array('d', value['power'])
+        except TypeError:
+            raise TypeError('Expected columns of float or int.') from None
+        size = self.sweep_table_size
+        if len(frequency) != len(power) or not len(frequency) <= size:
+            raise ValueError('Expected columns of equal length of at most {} rows.'
+                             .format(size))
+        if any(map(isnan, frequency)) or any(map(isnan, power)):
+            raise ValueError('Expected float, got NaN.')
+        for column, c_range, unit in ((frequency, self.frequency_range, 'Hz'),
+                                      (power, self.power_range, 'dBm')):
+            if column and c_range is not None and not (
+                    c_range['start'] <= min(column) and max(column) <= c_range['stop']):
+                raise ValueError('Expected float in range [{}, {}] {}.'.format(
+                                 c_range['start'], c_range['stop'], unit))
+        time_step = value.get('time_step')
+        if time_step is not None and not isinstance(time_step, (float, int)):
+            raise ValueError('Expected scalar time step: the time step applies to all rows.')
+        with self._parent.batch():
+            for row, (freq, pwr) in enumerate(zip(frequency, power)):
+                self.write_changed('sweep_table_freq', row, freq / 1e6)
+                self.write_changed('sweep_table_power', row, pwr)
+            if len(frequency) < size:
+                self.write_changed('sweep_table_freq', len(frequency), 0.)
+            if time_step is not None:
+                self.write_changed('sweep_time_step', time_step)
+
+    @property
+    def am_table_size(self):
+        """Number of rows in the AM lookup table.
+
+        Returns:
+            int: rows
+        """
+        return 100
+
+    @property
+    def am_table(self):
+        """Get AM lookup table in dBm.
+
+        Returns:
+            array: array('d') of power in dBm per row
+        """
+        return array('d', self.read_many(*(('am_lookup_table', row)
+                                           for row in range(self.am_table_size))))
+
+    @am_table.setter
+    def am_table(self, values):
+        """Set AM lookup table in dBm, starting at row 0.
+
+        The table is validated as a whole and uploaded in a single transfer.
+        Rows equal to the known device state, e.g. from the last upload, are
+        not sent.
+
+        Args:
+            values (iterable): power in dBm per row, e.g. list or numpy array
+        """
+        try:
+            values = array('d', values)
+        except TypeError:
+            raise TypeError('Expected iterable of float or int.') from None
+        size = self.am_table_size
+        if not len(values) <= size:
+            raise ValueError('Expected at most {} rows.'.format(size))
+        if any(map(isnan, values)):
+            raise ValueError('Expected float, got NaN.')
+        p_range = self.power_range
+        if values and p_range is not None and not (
+                p_range['start'] <= min(values) and max(values) <= p_range['stop']):
+            raise ValueError('Expected float in range [{}, {}] dBm.'.format(
+                             p_range['start'], p_range['stop']))
+        with self._parent.batch():
+            for row, value in enumerate(values):
+                self.write_changed('am_lookup_table', row, value)
+
 
 class SynthHDv2Channel(SynthHDChannel):
 
@@ -282,16 +568,9 @@ class SynthHDv2Channel(SynthHDChannel):
         self._parent = parent
         self._index = index
         model = self._parent.model
-        if model == 'SynthHD v2':
-            self._f_range = {'start': 10.e6, 'stop': 15000.e6, 'step': 0.1}
-            self._p_range = {'start': -70., 'stop': 20., 'step': 0.01}
-            self._vga_range = {'start': 0, 'stop': 4000, 'step': 1}
-            self._cspacing_range = {'start': 0.1, 'stop': 1000., 'step': 0.1}
-        elif model == 'SynthHD PRO v2':
-            self._f_range = {'start': 10.e6, 'stop': 24000.e6, 'step': 0.1}
-            self._p_range = {'start': -70., 'stop': 20., 'step': 0.01}
-            self._vga_range = {'start': 0, 'stop': 4000, 'step': 1}
-            self._cspacing_range = {'start': 0.1, 'stop': 1000., 'step': 0.1}
+        if model in ('SynthHD v2', 'SynthHD PRO v2'):
+            (self._f_range, self._p_range, self._vga_range,
+             self._cspacing_range) = _CHANNEL_RANGES[model]
         else:
             self._f_range = None
             self._p_range = None
@@ -371,6 +650,8 @@ class SynthHD(SerialDevice, Sequence):
         'sweep_type':       (int,   'X{}',     'X?'),  # Sweep type {0: linear, 1: tabular}
         'sweep_single':     (bool,  'g{}',     'g?'),
         'sweep_cont':       (bool,  'c{}',     'c?'),
+        'sweep_table_freq': ((int, float), 'L{}f{:.8f}', 'L{}f?'),  # Sweep table row frequency in MHz, 0 ends table
+        'sweep_table_power': ((int, float), 'L{}a{:.3f}', 'L{}a?'),  # Sweep table row power in dBm
 
         'am_time_step':     (int,   'F{}',     'F?'),  # Time step in microseconds
         'am_num_samples':   (int,   'q{}',     'q?'),  # Number of samples in one burst
@@ -392,33 +673,178 @@ class SynthHD(SerialDevice, Sequence):
         'fm_cont':          (bool,  '/{}',     '/?'),
     }
 
-    def __init__(self, devpath):
-        super().__init__(devpath)
-        self._model = None
-        self._model = self.model
-        if 'v2' in self.model:
-            channel_type = SynthHDv2Channel
-        else:
-            channel_type = SynthHDChannel
-        self._channels = [channel_type(self, index) for index in range(2)]
+    # Attributes that do not depend on the selected channel
+    DEVICE_ATTRIBUTES = frozenset((
+        'channel', 'model_type', 'serial_number', 'fw_version', 'hw_version',
+        'sub_version', 'save', 'reference_mode', 'trig_function', 'temperature',
+        'ref_frequency',
+    ))
+
+    CACHE_TTL = {
+        'channel':          0.,
+        'calibrated':       0.,
+        'vga_dac':          0.,   # Changed by power set and temperature compensation
+        'pll_lock':         0.,
+        'sweep_single':     0.,
+        'temperature':      1.,
+    }
+
+    TIMEOUTS = {
+        'save':             2.,   # EEPROM write, the next response is delayed
+    }
+
+    def __init__(self, devpath, model=None, identity_cache=None, **kwargs):
+        """Open SynthHD.
+
+        The model is detected on first use, unless given or found in the
+        identity cache, so that construction only opens the port.
+
+        Args:
+            devpath (str): serial device path
+            model (str): model version, see `model`, detected by default
+            identity_cache (str): path of a JSON file of models by device
+                path, read and updated on detection. Paths such as
+                /dev/serial/by-id/... that name the device make stable keys.
+            **kwargs: SerialDevice options, e.g. cache or dirty_only
+        """
+        if model is not None and model not in _CHANNEL_RANGES:
+            raise ValueError('Expected str in set {}.'.format(tuple(_CHANNEL_RANGES)))
+        if model is None and identity_cache is not None:
+            model = _load_identities(identity_cache).get(devpath)
+            if model not in _CHANNEL_RANGES:
+                model = None
+        self._channel = None
+        self._selected_channel = None
+        self._model = model
+        self._identity_cache = identity_cache
+        self._channels = None
+        super().__init__(devpath, **kwargs)
 
     def __getitem__(self, key):
-        return self._channels.__getitem__(key)
+        return self._get_channels().__getitem__(key)
 
     def __len__(self):
-        return self._channels.__len__()
+        return 2
+
+    def _get_channels(self):
+        """Channels, created on first use."""
+        if self._channels is None:
+            with self._lock:
+                if self._channels is None:
+                    model = self.model
+                    if model is not None and 'v2' in model:
+                        channel_type = SynthHDv2Channel
+                    else:
+                        channel_type = SynthHDChannel
+                    self._channels = [channel_type(self, index) for index in range(2)]
+        return self._channels
+
+    def write(self, attribute, *args):
+        if attribute != 'channel':
+            return super().write(attribute, *args)
+        with self._lock:
+            super().write(attribute, *args)
+            self._channel = self._selected_channel = int(*args)
+
+    def _invalidate(self):
+        super()._invalidate()
+        self._selected_channel = None
+
+    def _scope(self, attribute):
+        return None if attribute in self.DEVICE_ATTRIBUTES else self._channel
+
+    def _set_scope(self, scope):
+        previous = self._channel
+        if scope is not None:
+            self._channel = scope
+        return previous
+
+    def _preamble(self, attribute):
+        if (attribute in self.DEVICE_ATTRIBUTES or self._channel is None
+                or self._channel == self._selected_channel):
+            return b''
+        self._selected_channel = self._channel
+        data = self._commands['channel'].encode_write((self._channel,))[1]
+        if self._instrumentation is not None:
+            self._instrumentation.record('write', 'channel', monotonic(), 0., len(data))
+        return data
 
     def init(self):
         """Initialize device: put into a known, safe state."""
-        self.reference_mode = 'internal 27mhz'
-        self.trigger_mode = 'disabled'
-        self.sweep_enable = False
-        self.am_enable = False
-        self.pulse_mod_enable = False
-        self.dual_pulse_mod_enable = False
-        self.fm_enable = False
-        for channel in self:
-            channel.init()
+        self._selected_channel = None
+        with self.batch():
+            self.reference_mode = 'internal 27mhz'
+            self.trigger_mode = 'disabled'
+            self.sweep_enable = False
+            self.am_enable = False
+            self.pulse_mod_enable = False
+            self.dual_pulse_mod_enable = False
+            self.fm_enable = False
+            for channel in self:
+                channel.init()
+
+    def snapshot(self, tables=False):
+        """Read the full configuration, pipelining the queries.
+
+        Reads are served by the cache if enabled.
+
+        Args:
+            tables (bool): include the AM and sweep lookup tables
+
+        Returns:
+            SynthHDState: configuration
+        """
+        channel_attributes = [attribute for attribute in _STATE_CHANNEL_ATTRIBUTES
+                              if attribute != 'channelspacing' or 'v2' in (self.model or '')]
+        keys = [(None, attribute) for attribute in _STATE_DEVICE_ATTRIBUTES]
+        for index in range(len(self)):
+            keys += [(index, attribute) for attribute in channel_attributes]
+            if tables:
+                keys += [(index, 'am_lookup_table', row)
+                         for row in range(self[index].am_table_size)]
+                for row in range(self[index].sweep_table_size):
+                    keys += [(index, 'sweep_table_freq', row), (index, 'sweep_table_power', row)]
+        with self.transaction():
+            return SynthHDState(zip(keys, self._read_keys(keys)))
+
+    def apply(self, state, base=None):
+        """Write the attributes of a configuration that differ, in one batch.
+
+        Switches, e.g. rf_enable or am_cont, turned off are written first
+        and those turned on last, so that outputs are only enabled once
+        configured.
+
+        Args:
+            state (SynthHDState): configuration, e.g. from snapshot
+            base (SynthHDState): configuration of the device to compare to,
+                by default the state written or read by this object. Values
+                not known are written.
+
+        Returns:
+            int: number of attributes written
+        """
+        switches_off, settings, switches_on = [], [], []
+        for key, value in state.items():
+            if key[1] not in _STATE_SWITCHES:
+                settings.append((key, value))
+            elif value:
+                switches_on.append((key, value))
+            else:
+                switches_off.append((key, value))
+        written = 0
+        with self.batch():
+            channel = self._channel
+            try:
+                for key, value in switches_off[::-1] + settings + switches_on:
+                    if base is not None and key in base:
+                        normalize = self._commands[key[1]].normalize
+                        if normalize(base[key]) == normalize(value):
+                            continue
+                    self._set_scope(key[0])
+                    written += self._write_attribute(key[1], key[2:] + (value,), base is None)
+            finally:
+                self._channel = channel
+        return written
 
     @property
     def model(self):
@@ -429,21 +855,14 @@ class SynthHD(SerialDevice, Sequence):
         """
         if self._model is not None:
             return self._model
-        hw_ver = self.hardware_version
-        if 'Version 2.' in hw_ver:
-            sub_ver = self.read('sub_version')
-            if sub_ver == 'HD':
-                return 'SynthHD v2'
-            elif sub_ver == 'HDPRO':
-                return 'SynthHD PRO v2'
-            else:
-                # Unsupported sub-version. Return None.
-                return None
-        elif 'Version 1.4' in hw_ver:
-            return 'SynthHD v1.4'
-        else:
-            # Unsupported hardware version. Return None.
-            return None
+        with self._lock:
+            if self._model is None:
+                hw_ver = self.hardware_version
+                sub_ver = self.read('sub_version') if 'Version 2.' in hw_ver else None
+                self._model = _model(hw_ver, sub_ver)
+                if self._model is not None and self._identity_cache is not None:
+                    _store_identity(self._identity_cache, self._devpath, self._model)
+            return self._model
 
     @property
     def model_type(self):
@@ -492,7 +911,7 @@ class SynthHD(SerialDevice, Sequence):
         Returns:
             tuple: tuple of str of modes
         """
-        return ('external', 'internal 27mhz', 'internal 10mhz')
+        return _REFERENCE_MODES
 
     @property
     def reference_mode(self):
@@ -522,18 +941,7 @@ class SynthHD(SerialDevice, Sequence):
         Returns:
             tuple: tuple of str of modes
         """
-        return (
-            'disabled',
-            'full frequency sweep',
-            'single frequency step',
-            'stop all',
-            'rf enable',
-            'remove interrupts',
-            'reserved',
-            'reserved',
-            'am modulation',
-            'fm modulation',
-        )
+        return _TRIGGER_MODES
 
     @property
     def trigger_mode(self):
@@ -697,3 +1105,255 @@ class SynthHD(SerialDevice, Sequence):
         if not isinstance(value, bool):
             raise ValueError('Expected bool.')
         self.write('fm_cont', value)
+
+
+class _Reads(Exception):
+    """Reads a request model needs to continue, see _RequestModel."""
+
+    def __init__(self, requests):
+        super().__init__(requests)
+        self.requests = requests
+
+
+class _RequestModel:
+    """Runs getters and setters of the blocking front-end without I/O.
+
+    Writes are collected in `writes`, and reads are served from `values` by
+    request (attribute, *args) or raise _Reads. The asyncio front-end does
+    the I/O, so that validation and conversions are defined once.
+    """
+
+    def __init__(self):
+        self.writes = []
+        self.values = {}
+
+    def batch(self):
+        return nullcontext()
+
+    def write(self, attribute, *args):
+        self.writes.append((attribute, args))
+
+    def write_changed(self, attribute, *args):
+        self.write(attribute, *args)
+        return True
+
+    def read(self, attribute, *args):
+        return self.read_many((attribute, *args))[0]
+
+    def read_many(self, *requests):
+        missing = [request for request in requests if request not in self.values]
+        if missing:
+            raise _Reads(missing)
+        return [self.values[request] for request in requests]
+
+
+class _ChannelModel(_RequestModel, SynthHDv2Channel):
+
+    def __init__(self, model, index):
+        super().__init__()
+        # Channel code batches through its parent
+        self._parent = self
+        self._index = index
+        (self._f_range, self._p_range, self._vga_range,
+         self._cspacing_range) = _CHANNEL_RANGES.get(model, (None, None, None, None))
+
+
+class _DeviceModel(_RequestModel, SynthHD):
+    pass
+
+
+class _AsyncFrontEnd:
+    """Coroutine accessors running the properties of a _RequestModel."""
+
+    async def _get(self, name):
+        values = {}
+        while True:
+            self._shadow.values = values
+            try:
+                return getattr(self._shadow, name)
+            except _Reads as reads:
+                # Pipelined, responses are matched in order
+                values.update(zip(reads.requests, await asyncio.gather(
+                    *(self.read(*request) for request in reads.requests))))
+
+    async def _run(self, func, *args):
+        self._shadow.writes = writes = []
+        func(self._shadow, *args)
+        for attribute, args in writes:
+            await self.write(attribute, *args)
+
+
+def _async_accessors(model, getters=(), setters=(), properties=()):
+    """Class decorator adding get_<name> and set_<name> coroutines, and plain
+    properties, for the properties of a _RequestModel class.
+    """
+    def getter(name, prop):
+        async def get(self):
+            return await self._get(name)
+        get.__name__ = 'get_' + name
+        get.__doc__ = prop.fget.__doc__
+        return get
+
+    def setter(name, prop):
+        async def set(self, value):
+            await self._run(setattr, name, value)
+        set.__name__ = 'set_' + name
+        set.__doc__ = prop.fset.__doc__ or prop.fget.__doc__
+        return set
+
+    def decorate(cls):
+        for name in getters:
+            setattr(cls, 'get_' + name, getter(name, getattr(model, name)))
+        for name in setters:
+            setattr(cls, 'set_' + name, setter(name, getattr(model, name)))
+        for name in properties:
+            prop = getattr(model, name)
+            setattr(cls, name, property(lambda self, name=name: getattr(self._shadow, name),
+                                        doc=prop.__doc__))
+        return cls
+    return decorate
+
+
+@_async_accessors(
+    _ChannelModel,
+    getters=('frequency', 'power', 'calibrated', 'temp_compensation_mode', 'vga_dac', 'phase',
+             'rf_enable', 'pa_enable', 'pll_enable', 'enable', 'lock_status',
+             'channel_spacing', 'sweep_table', 'am_table'),
+    setters=('frequency', 'power', 'temp_compensation_mode', 'vga_dac', 'phase', 'rf_enable',
+             'pa_enable', 'pll_enable', 'enable', 'channel_spacing', 'sweep_table', 'am_table'),
+    properties=('frequency_range', 'power_range', 'temp_compensation_modes', 'vga_dac_range',
+                'phase_range', 'channel_spacing_range', 'sweep_table_size', 'am_table_size'))
+class AsyncSynthHDChannel(_AsyncFrontEnd):
+    """Asyncio front-end to SynthHDChannel.
+
+    Every property of SynthHDChannel has coroutine get_<name> and, unless
+    read-only, set_<name> accessors, e.g. set_frequency. The channel spacing
+    is only supported by SynthHD >= v2.
+    """
+
+    def __init__(self, parent, index):
+        self._parent = parent
+        self._index = index
+        self._shadow = _ChannelModel(parent.model, index)
+
+    async def init(self):
+        """Initialize channel."""
+        await self._run(SynthHDChannel.init)
+
+    # The channel is selected and the request encoded without awaiting in
+    # between, so other tasks cannot redirect the command
+    async def write(self, attribute, *args):
+        self.select()
+        await self._parent.write(attribute, *args)
+
+    async def read(self, attribute, *args):
+        self.select()
+        return await self._parent.read(attribute, *args)
+
+    async def write_changed_many(self, parameters, writes=()):
+        """Write parameters, then commands, see SynthHDChannel.
+
+        There is no known state, so that all parameters are written.
+
+        Returns:
+            int: number of parameters written
+        """
+        parameters = list(parameters)
+        for attribute, *args in (*parameters, *writes):
+            await self.write(attribute, *args)
+        return len(parameters)
+
+    def select(self):
+        """Select channel.
+
+        The select command is deferred until the next channel command and is
+        skipped if the channel is already selected on the device.
+        """
+        self._parent._channel = self._index
+
+
+@_async_accessors(
+    _DeviceModel,
+    getters=('model_type', 'serial_number', 'firmware_version', 'hardware_version',
+             'reference_mode', 'trigger_mode', 'temperature', 'reference_frequency',
+             'sweep_enable', 'am_enable', 'pulse_mod_enable', 'dual_pulse_mod_enable',
+             'fm_enable'),
+    setters=('reference_mode', 'trigger_mode', 'reference_frequency', 'sweep_enable',
+             'am_enable', 'pulse_mod_enable', 'dual_pulse_mod_enable', 'fm_enable'),
+    properties=('reference_modes', 'trigger_modes', 'reference_frequency_range'))
+class AsyncSynthHD(AsyncSerialDevice, _AsyncFrontEnd, Sequence):
+    """Asyncio front-end to SynthHD.
+
+    Shares the SynthHD command table and models, with coroutine getters and
+    setters in place of properties:
+
+        async with AsyncSynthHD('/dev/ttyACM0') as synth:
+            await synth[0].set_frequency(2.e9)
+    """
+
+    API = SynthHD.API
+    DEVICE_ATTRIBUTES = SynthHD.DEVICE_ATTRIBUTES
+    TIMEOUTS = SynthHD.TIMEOUTS
+
+    def __init__(self, devpath, **kwargs):
+        """Create SynthHD. The port is opened by `open`.
+
+        Args:
+            devpath (str): serial device path
+            **kwargs: AsyncSerialDevice options, e.g. timeout or
+                serial_factory
+        """
+        super().__init__(devpath, **kwargs)
+        self._channel = None
+        self._selected_channel = None
+        self._model = None
+        self._channels = []
+        self._shadow = _DeviceModel()
+
+    def __getitem__(self, key):
+        return self._channels.__getitem__(key)
+
+    def __len__(self):
+        return self._channels.__len__()
+
+    async def open(self):
+        await super().open()
+        if self._model is None:
+            hw_ver = await self.get_hardware_version()
+            sub_ver = await self.read('sub_version') if 'Version 2.' in hw_ver else None
+            self._model = _model(hw_ver, sub_ver)
+            self._channels = [AsyncSynthHDChannel(self, index) for index in range(2)]
+
+    async def write(self, attribute, *args):
+        await super().write(attribute, *args)
+        if attribute == 'channel':
+            self._channel = self._selected_channel = int(*args)
+
+    def _invalidate(self):
+        super()._invalidate()
+        self._selected_channel = None
+
+    _preamble = SynthHD._preamble
+
+    async def init(self):
+        """Initialize device: put into a known, safe state."""
+        self._selected_channel = None
+        await self.set_reference_mode('internal 27mhz')
+        await self.set_trigger_mode('disabled')
+        for attribute in ('sweep_cont', 'am_cont', 'pulse_cont', 'dual_pulse_mod', 'fm_cont'):
+            await self.write(attribute, False)
+        for channel in self:
+            await channel.init()
+
+    @property
+    def model(self):
+        """Model version, detected on open.
+
+        Returns:
+            str: model version or None if unsupported
+        """
+        return self._model
+
+    async def save(self):
+        """Save all settings to non-volatile EEPROM."""
+        await self.write('save')